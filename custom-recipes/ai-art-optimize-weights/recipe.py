@@ -0,0 +1,61 @@
+import logging
+import pathlib
+import tempfile
+
+import dataiku
+from dataiku.customrecipe import (
+    get_input_names_for_role,
+    get_output_names_for_role,
+    get_recipe_config,
+)
+
+from ai_art.convert import convert_weights
+from ai_art.folder import download_folder, upload_folder
+from ai_art.params import get_optimize_weights_config
+
+weights_folder_name = get_input_names_for_role("weights_folder")[0]
+optimized_weights_folder_name = get_output_names_for_role(
+    "optimized_weights_folder"
+)[0]
+weights_folder = dataiku.Folder(weights_folder_name)
+optimized_weights_folder = dataiku.Folder(optimized_weights_folder_name)
+recipe_config = get_recipe_config()
+
+params = get_optimize_weights_config(
+    recipe_config, weights_folder, optimized_weights_folder
+)
+logging.info("Generated params: %r", params)
+
+# Download the weights folder to a local temp dir so that they can be
+# converted.
+# This is only needed if the managed folder is remote, since local
+# folders can be accessed directly
+if params.temp_weights_dir is not None:
+    logging.info(
+        "Downloading weights to local folder: %r", params.weights_path
+    )
+    download_folder(
+        params.weights_folder,
+        params.weights_path,
+        max_workers=params.download_workers,
+        remote_files=params.weights_files,
+    )
+
+if params.clear_folder:
+    logging.info(
+        "Clearing optimized weights folder: %r",
+        params.optimized_weights_folder.name,
+    )
+    params.optimized_weights_folder.clear()
+
+with tempfile.TemporaryDirectory(
+    prefix="dss-plugin-ai-art-optimized-weights-"
+) as output_dir:
+    output_path = pathlib.Path(output_dir)
+    convert_weights(
+        params.weights_path, output_path, torch_dtype=params.torch_dtype
+    )
+    upload_folder(output_path, params.optimized_weights_folder)
+
+if params.temp_weights_dir is not None:
+    params.temp_weights_dir.cleanup()
@@ -7,7 +7,7 @@ from dataiku.customrecipe import (
     get_recipe_config,
 )
 
-from ai_art.folder import download_folder
+from ai_art.folder import FolderDownload
 from ai_art.generate_image import TextGuidedImageToImage
 from ai_art.params import get_text_guided_image_to_image_config
 from ai_art.save import save_images
@@ -28,23 +28,49 @@ params = get_text_guided_image_to_image_config(
 )
 logging.info("Generated params: %r", params)
 
-# Download the weights folder to a local temp dir so that the pipeline
-# can access them.
+# Download the weights folder to a local dir so that the pipeline can
+# access them.
 # This is only needed if the managed folder is remote, since local
-# folders can be accessed directly
-if params.temp_weights_dir is not None:
+# folders can be accessed directly. Weights that are already in the
+# local weights cache don't need to be downloaded again.
+# The download runs in the background, and each pipeline component is
+# loaded as soon as its files are downloaded
+if params.weights_cache_entry is not None:
+    needs_download = not params.weights_cache_entry.is_complete
+else:
+    needs_download = params.temp_weights_dir is not None
+
+if needs_download:
     logging.info(
         "Downloading weights to local folder: %r", params.weights_path
     )
-    download_folder(params.weights_folder, params.weights_path)
+    weights_download = FolderDownload(
+        params.weights_folder,
+        params.weights_path,
+        max_workers=params.download_workers,
+        remote_files=params.weights_files,
+    )
+    weights_download.start()
+else:
+    weights_download = None
 
 generator = TextGuidedImageToImage(
     params.weights_path,
     device_id=params.device_id,
     torch_dtype=params.torch_dtype,
     enable_attention_slicing=params.enable_attention_slicing,
+    weights_download=weights_download,
+    parallel_loading=True,
+    low_cpu_mem_usage=params.low_memory_loading,
+    # The recipe only loads one pipeline
+    reuse_pipeline=False,
 )
 
+if weights_download is not None:
+    weights_download.wait()
+    if params.weights_cache_entry is not None:
+        params.weights_cache_entry.commit()
+
 if params.clear_folder:
     logging.info("Clearing image folder: %r", params.image_folder.name)
     params.image_folder.clear()
@@ -65,3 +91,5 @@ save_images(images, params.image_folder, params.filename_prefix)
 
 if params.temp_weights_dir is not None:
     params.temp_weights_dir.cleanup()
+if params.weights_cache_entry is not None:
+    params.weights_cache_entry.cleanup()
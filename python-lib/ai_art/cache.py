@@ -0,0 +1,350 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import time
+
+_MANIFEST_FILENAME = "manifest.json"
+_LOCK_FILENAME = "entry.lock"
+_LAST_USED_FILENAME = "last-used"
+_WEIGHTS_DIRNAME = "weights"
+
+
+def get_default_cache_dir():
+    """Get the default directory of the local weights cache
+
+    :return: Path to the default cache dir
+    :rtype: pathlib.Path
+    """
+    return pathlib.Path.home() / ".cache" / "dss-plugin-ai-art" / "weights"
+
+
+def _compute_cache_key(folder_id, remote_files):
+    """Compute the key of a cache entry
+
+    The key changes whenever a file of the folder is added, removed or
+    modified, so stale entries are never reused
+
+    :param folder_id: ID of the managed folder
+    :type folder_id: str
+    :param remote_files: Files of the managed folder
+    :type remote_files: Iterable[ai_art.folder.RemoteFile]
+
+    :return: Cache key
+    :rtype: str
+    """
+    manifest = [folder_id, [list(remote_file) for remote_file in remote_files]]
+    digest = hashlib.sha256(json.dumps(manifest).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+class WeightsCacheEntry:
+    """Entry of the local weights cache
+
+    While the entry is acquired, a lock is held on it so that it can't
+    be evicted by another process. The lock is exclusive until the
+    entry is complete, and shared afterwards
+    """
+
+    __slots__ = ("_entry_dir", "_remote_files", "_folder_id", "_lock_file")
+
+    def __init__(self, entry_dir, folder_id, remote_files, lock_file):
+        """
+        :param entry_dir: Directory of the entry
+        :type entry_dir: pathlib.Path
+        :param folder_id: ID of the managed folder that the entry is a
+            copy of
+        :type folder_id: str
+        :param remote_files: Files of the managed folder
+        :type remote_files: list[ai_art.folder.RemoteFile]
+        :param lock_file: Open lock file of the entry, already locked
+        :type lock_file: io.IOBase
+
+        :return: None
+        """
+        self._entry_dir = entry_dir
+        self._folder_id = folder_id
+        self._remote_files = remote_files
+        self._lock_file = lock_file
+
+    @property
+    def path(self):
+        """Path to the local copy of the weights
+
+        :rtype: pathlib.Path
+        """
+        return self._entry_dir / _WEIGHTS_DIRNAME
+
+    @property
+    def remote_files(self):
+        """Files of the managed folder that the entry is a copy of
+
+        :rtype: list[ai_art.folder.RemoteFile]
+        """
+        return self._remote_files
+
+    @property
+    def is_complete(self):
+        """Whether the weights have been fully downloaded to the entry
+
+        :rtype: bool
+        """
+        return (self._entry_dir / _MANIFEST_FILENAME).exists()
+
+    def commit(self):
+        """Mark the entry as complete
+
+        This must be called once the weights have been downloaded to
+        `path`. The lock is downgraded to a shared lock so that other
+        processes can use the entry
+
+        :return: None
+        """
+        manifest = {
+            "folder_id": self._folder_id,
+            "files": [
+                remote_file._asdict() for remote_file in self._remote_files
+            ],
+            "size": sum(
+                remote_file.size for remote_file in self._remote_files
+            ),
+            "created": time.time(),
+        }
+        temp_path = self._entry_dir / f"{_MANIFEST_FILENAME}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(temp_path, self._entry_dir / _MANIFEST_FILENAME)
+
+        fcntl.flock(self._lock_file, fcntl.LOCK_SH)
+
+    def cleanup(self):
+        """Release the entry so that it can be evicted
+
+        :return: None
+        """
+        if not self._lock_file.closed:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+
+
+class WeightsCache:
+    """Host-level cache of the weights of remote managed folders
+
+    Each entry is keyed by the folder ID and a manifest of its file
+    paths, sizes and modification times, so that it's reused across
+    runs and projects as long as the folder doesn't change. Entries are
+    evicted in least-recently-used order once the cache exceeds
+    `max_size`. Entries that are in use by another process are never
+    evicted
+    """
+
+    __slots__ = ("_cache_dir", "_max_size")
+
+    def __init__(self, cache_dir=None, max_size=None):
+        """
+        :param cache_dir: Directory of the cache. If `None`, the
+            default cache dir will be used
+        :type cache_dir: str | os.PathLike | None
+        :param max_size: Maximum size of the cache in bytes, or `None`
+            for no limit
+        :type max_size: int | None
+
+        :return: None
+        """
+        if cache_dir is None:
+            cache_dir = get_default_cache_dir()
+
+        self._cache_dir = pathlib.Path(cache_dir)
+        self._max_size = max_size
+
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def cache_dir(self):
+        """Directory of the cache
+
+        :rtype: pathlib.Path
+        """
+        return self._cache_dir
+
+    def acquire(self, folder, remote_files):
+        """Acquire the cache entry of a managed folder
+
+        If the entry is complete, it can be used right away. Otherwise
+        the folder must be downloaded to `entry.path` and
+        `entry.commit()` must be called. `entry.cleanup()` must be
+        called once the weights aren't needed anymore
+
+        :param folder: Managed folder
+        :type folder: Dataiku.folder
+        :param remote_files: Files of the folder that will be cached
+        :type remote_files: list[ai_art.folder.RemoteFile]
+
+        :return: Cache entry, locked
+        :rtype: WeightsCacheEntry
+        """
+        folder_id = folder.get_id()
+        key = _compute_cache_key(folder_id, remote_files)
+
+        entry_dir = self._cache_dir / key
+        lock_file = self._lock_entry(entry_dir)
+        entry = WeightsCacheEntry(
+            entry_dir, folder_id, remote_files, lock_file
+        )
+
+        if not entry.is_complete:
+            # Another process may be downloading the entry. Wait for it
+            # to finish, then check again
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if entry.is_complete:
+                fcntl.flock(lock_file, fcntl.LOCK_SH)
+
+        (entry_dir / _LAST_USED_FILENAME).touch()
+
+        if entry.is_complete:
+            logging.info("Using cached weights: %s", entry.path)
+        else:
+            logging.info("Weights aren't cached yet. Cache entry: %s", key)
+            new_size = sum(remote_file.size for remote_file in remote_files)
+            self.evict(reserve=new_size, keep=key)
+
+        return entry
+
+    @staticmethod
+    def _lock_entry(entry_dir):
+        """Create the entry dir if needed, and lock it with a shared lock
+
+        :param entry_dir: Directory of the entry
+        :type entry_dir: pathlib.Path
+
+        :return: Open lock file of the entry
+        :rtype: io.IOBase
+        """
+        lock_path = entry_dir / _LOCK_FILENAME
+        while True:
+            entry_dir.mkdir(parents=True, exist_ok=True)
+            lock_file = open(lock_path, "a")
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+
+            # The entry may have been evicted by another process while
+            # we were waiting for the lock. In that case, the lock file
+            # that we locked was deleted, so try again
+            try:
+                current_inode = os.stat(lock_path).st_ino
+            except FileNotFoundError:
+                current_inode = None
+
+            if current_inode == os.fstat(lock_file.fileno()).st_ino:
+                return lock_file
+
+            lock_file.close()
+
+    def _list_entries(self):
+        """List the cache entries
+
+        :return: Entries, sorted from least to most recently used. Each
+            entry is represented by a (last used time, entry dir, size)
+            tuple
+        :rtype: list[tuple[float, pathlib.Path, int]]
+        """
+        entries = []
+        for entry_dir in self._cache_dir.iterdir():
+            if not entry_dir.is_dir():
+                continue
+
+            try:
+                with open(entry_dir / _MANIFEST_FILENAME) as file:
+                    size = json.load(file)["size"]
+            except (OSError, ValueError, KeyError):
+                # Incomplete entry. Count the bytes that are already
+                # downloaded
+                size = 0
+                for path in entry_dir.rglob("*"):
+                    try:
+                        size += path.stat().st_size
+                    except OSError:
+                        # Removed while the entry is being downloaded
+                        pass
+
+            try:
+                last_used = (entry_dir / _LAST_USED_FILENAME).stat().st_mtime
+            except OSError:
+                last_used = 0.0
+
+            entries.append((last_used, entry_dir, size))
+
+        entries.sort(key=lambda entry: entry[0])
+        return entries
+
+    def evict(self, reserve=0, keep=None):
+        """Evict least-recently-used entries until the cache fits in
+        `max_size`
+
+        :param reserve: Number of bytes to free up in addition to
+            `max_size`, e.g. for an entry that's about to be downloaded
+        :type reserve: int
+        :param keep: Key of an entry that must not be evicted
+        :type keep: str | None
+
+        :return: None
+        """
+        if self._max_size is None:
+            return
+
+        with self._global_lock():
+            entries = [
+                entry
+                for entry in self._list_entries()
+                if entry[1].name != keep
+            ]
+            total_size = sum(size for _, _, size in entries) + reserve
+
+            for _, entry_dir, size in entries:
+                if total_size <= self._max_size:
+                    break
+
+                if self._try_remove_entry(entry_dir):
+                    logging.info("Evicted cached weights: %s", entry_dir.name)
+                    total_size -= size
+
+            if total_size > self._max_size:
+                logging.warning(
+                    "The weights cache exceeds its maximum size (%s bytes "
+                    "needed, %s bytes allowed) because the remaining entries "
+                    "are in use",
+                    total_size,
+                    self._max_size,
+                )
+
+    @staticmethod
+    def _try_remove_entry(entry_dir):
+        """Remove an entry unless another process is using it
+
+        :param entry_dir: Directory of the entry
+        :type entry_dir: pathlib.Path
+
+        :return: Whether the entry was removed
+        :rtype: bool
+        """
+        with open(entry_dir / _LOCK_FILENAME, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return True
+
+    @contextlib.contextmanager
+    def _global_lock(self):
+        """Lock the whole cache while entries are being evicted"""
+        with open(self._cache_dir / "cache.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import threading
+import weakref
+
+from ai_art.convert import hash_file
+
+
+class ComponentStore:
+    """In-process store of loaded pipeline components
+
+    Components are keyed by the hashes of the files in their subfolder,
+    so that a component is shared between pipelines whose weights
+    folders contain identical files, e.g. the same VAE or text encoder.
+    The store only keeps weak references: a component stays in the
+    store as long as a pipeline uses it
+    """
+
+    __slots__ = ("_components", "_file_hashes", "_lock")
+
+    def __init__(self):
+        self._components = weakref.WeakValueDictionary()
+        # Hashes of the files that were already hashed, keyed by
+        # (path, size, modification time)
+        self._file_hashes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._components)
+
+    def _hash_file(self, path):
+        """Hash a file, reusing its hash if it hasn't changed
+
+        :param path: Path to the file
+        :type path: pathlib.Path
+
+        :return: Hex digest
+        :rtype: str
+        """
+        stat = path.stat()
+        file_key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            file_hash = self._file_hashes.get(file_key)
+
+        if file_hash is None:
+            file_hash = hash_file(path)
+            with self._lock:
+                self._file_hashes[file_key] = file_hash
+
+        return file_hash
+
+    def make_key(self, component_path, component_class, torch_dtype, device):
+        """Make the key that identifies a loaded component in the store
+
+        :param component_path: Path to the component's subfolder
+        :type component_path: pathlib.Path
+        :param component_class: Class of the component
+        :type component_class: type
+        :param torch_dtype: dtype that the component is loaded under
+        :type torch_dtype: torch.dtype | None
+        :param device: Device that the component is used on
+        :type device: torch.device | None
+
+        :return: Key of the component
+        :rtype: tuple[str, ...]
+        """
+        files = [
+            [
+                path.relative_to(component_path).as_posix(),
+                self._hash_file(path),
+            ]
+            for path in sorted(component_path.rglob("*"))
+            if path.is_file()
+        ]
+        digest = hashlib.sha256(json.dumps(files).encode("utf-8"))
+
+        return (
+            f"{component_class.__module__}.{component_class.__qualname__}",
+            digest.hexdigest(),
+            str(torch_dtype),
+            str(device),
+        )
+
+    def get(self, key):
+        """Get a loaded component
+
+        :param key: Key of the component, made by `make_key()`
+        :type key: tuple[str, ...]
+
+        :return: Component, or `None` if it isn't loaded
+        :rtype: torch.nn.Module | None
+        """
+        with self._lock:
+            return self._components.get(key)
+
+    def add(self, key, component):
+        """Add a loaded component to the store
+
+        :param key: Key of the component, made by `make_key()`
+        :type key: tuple[str, ...]
+        :param component: Loaded component
+        :type component: torch.nn.Module
+
+        :return: None
+        """
+        with self._lock:
+            self._components[key] = component
+
+
+_default_store = ComponentStore()
+
+
+def get_component_store():
+    """Get the component store that the image generators use by default
+
+    :return: Default component store
+    :rtype: ComponentStore
+    """
+    return _default_store
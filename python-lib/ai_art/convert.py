@@ -0,0 +1,224 @@
+import hashlib
+import json
+import logging
+import posixpath
+import shutil
+import time
+
+import safetensors.torch
+import torch
+from diffusers import StableDiffusionPipeline
+
+from ai_art.folder import RemoteFile
+from ai_art.weights import (
+    MODEL_INDEX_PATH,
+    match_weights_filename,
+    select_pipeline_files,
+)
+
+MANIFEST_FILENAME = "ai-art-weights-manifest.json"
+
+# Name of the safetensors file that each library loads, keyed by the
+# name of the pickled file
+_SAFETENSORS_NAMES = {
+    "diffusion_pytorch_model": "diffusion_pytorch_model",
+    "pytorch_model": "model",
+    "model": "model",
+}
+
+
+def hash_file(path):
+    """Compute the SHA-256 hash of a file
+
+    :param path: Path to the file
+    :type path: pathlib.Path
+
+    :return: Hex digest
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024**2), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_state_dict(path):
+    """Load a state dict from a pickled or safetensors file
+
+    :param path: Path to the weights file
+    :type path: pathlib.Path
+
+    :return: State dict
+    :rtype: dict[str, torch.Tensor]
+    """
+    if path.suffix == ".safetensors":
+        return safetensors.torch.load_file(str(path), device="cpu")
+    else:
+        return torch.load(path, map_location="cpu")
+
+
+def _convert_state_dict(state_dict, torch_dtype):
+    """Prepare a state dict to be saved as safetensors
+
+    :param state_dict: State dict to convert
+    :type state_dict: dict[str, torch.Tensor]
+    :param torch_dtype: Cast the floating-point tensors to this dtype.
+        If `None`, the tensors aren't cast
+    :type torch_dtype: torch.dtype | None
+
+    :return: Converted state dict
+    :rtype: dict[str, torch.Tensor]
+    """
+    converted_state_dict = {}
+    data_ptrs = set()
+    for key, tensor in state_dict.items():
+        if (torch_dtype is not None) and tensor.is_floating_point():
+            tensor = tensor.to(torch_dtype)
+        tensor = tensor.contiguous()
+
+        # safetensors doesn't support tensors that share memory
+        if tensor.data_ptr() in data_ptrs:
+            tensor = tensor.clone()
+        data_ptrs.add(tensor.data_ptr())
+
+        converted_state_dict[key] = tensor
+
+    return converted_state_dict
+
+
+def _convert_weights_file(source_path, output_path, torch_dtype):
+    """Convert a single weights file to safetensors
+
+    :param source_path: Path to the pickled or safetensors file
+    :type source_path: pathlib.Path
+    :param output_path: Path to the safetensors file to create
+    :type output_path: pathlib.Path
+    :param torch_dtype: Cast the floating-point tensors to this dtype.
+        If `None`, the tensors aren't cast
+    :type torch_dtype: torch.dtype | None
+
+    :return: None
+    """
+    state_dict = _load_state_dict(source_path)
+    state_dict = _convert_state_dict(state_dict, torch_dtype)
+
+    # Transformers requires the "format" metadata
+    safetensors.torch.save_file(
+        state_dict, str(output_path), metadata={"format": "pt"}
+    )
+
+
+def _get_output_rel_path(selected_file):
+    """Get the path of a converted file, relative to the output dir
+
+    Single-file weights are renamed to the safetensors name that the
+    library loads. Other files, including sharded weights, keep their
+    name
+
+    :param selected_file: File of the source weights
+    :type selected_file: ai_art.folder.RemoteFile
+
+    :return: Relative path of the converted file, and whether the file
+        is converted to safetensors
+    :rtype: tuple[str, bool]
+    """
+    rel_path = (selected_file.local_path or selected_file.path).lstrip("/")
+    match = match_weights_filename(posixpath.basename(rel_path))
+    if (match is None) or match["shard"] or match["index"]:
+        return rel_path, False
+
+    filename = f"{_SAFETENSORS_NAMES[match['name']]}.safetensors"
+    return posixpath.join(posixpath.dirname(rel_path), filename), True
+
+
+def convert_weights(weights_path, output_path, *, torch_dtype=None):
+    """Write an optimized copy of a local weights folder
+
+    The copy only contains the files that the pipeline loads. Pickled
+    weights are converted to safetensors so that they can be loaded
+    memory-mapped without unpickling, and are cast to `torch_dtype`. A
+    manifest that lists the files of the copy and their hashes is also
+    written
+
+    :param weights_path: Path to the source weights folder
+    :type weights_path: pathlib.Path
+    :param output_path: Path to the dir that the copy is written to
+    :type output_path: pathlib.Path
+    :param torch_dtype: Cast the weights to this dtype, e.g.
+        `torch.float16`. If `None`, the weights aren't cast
+    :type torch_dtype: torch.dtype | None
+
+    :return: Manifest of the copy
+    :rtype: dict[str, Any]
+    """
+    source_files = [
+        RemoteFile(
+            path=f"/{path.relative_to(weights_path).as_posix()}",
+            size=path.stat().st_size,
+            last_modified=None,
+        )
+        for path in sorted(weights_path.rglob("*"))
+        if path.is_file()
+    ]
+
+    with open(weights_path / MODEL_INDEX_PATH.lstrip("/")) as file:
+        model_index = json.load(file)
+    selected_files = select_pipeline_files(
+        source_files,
+        model_index,
+        StableDiffusionPipeline,
+        torch_dtype=torch_dtype,
+    )
+
+    manifest_files = []
+    for selected_file in selected_files:
+        source_path = weights_path / selected_file.path.lstrip("/")
+        rel_path, is_converted = _get_output_rel_path(selected_file)
+        full_output_path = output_path / rel_path
+        full_output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        start_time = time.perf_counter()
+        if is_converted:
+            _convert_weights_file(source_path, full_output_path, torch_dtype)
+        else:
+            shutil.copyfile(source_path, full_output_path)
+
+        logging.info(
+            "%s %s to %s in %.1f s",
+            "Converted" if is_converted else "Copied",
+            selected_file.path,
+            rel_path,
+            time.perf_counter() - start_time,
+        )
+        manifest_files.append(
+            {
+                "path": f"/{rel_path}",
+                "source_path": selected_file.path,
+                "size": full_output_path.stat().st_size,
+                "sha256": hash_file(full_output_path),
+            }
+        )
+
+    source_size = sum(source_file.size for source_file in source_files)
+    output_size = sum(
+        manifest_file["size"] for manifest_file in manifest_files
+    )
+    logging.info(
+        "Optimized weights: %.1f MB (source: %.1f MB)",
+        output_size / 1024**2,
+        source_size / 1024**2,
+    )
+
+    manifest = {
+        "torch_dtype": None if torch_dtype is None else str(torch_dtype),
+        "format": "safetensors",
+        "files": manifest_files,
+        "size": output_size,
+        "source_size": source_size,
+        "created": time.time(),
+    }
+    with open(output_path / MANIFEST_FILENAME, "w") as file:
+        json.dump(manifest, file, indent=2)
+
+    return manifest
@@ -1,7 +1,36 @@
+import collections
+import concurrent.futures
 import logging
+import os
 import pathlib
 import shutil
 import tempfile
+import threading
+import time
+
+# Size of the chunks that are copied at once when downloading a file
+_CHUNK_SIZE = 8 * 1024**2
+# Suffix of the files that are still being downloaded
+_PART_SUFFIX = ".part"
+
+RemoteFile = collections.namedtuple(
+    "RemoteFile",
+    ("path", "size", "last_modified", "local_path"),
+    defaults=(None,),
+)
+RemoteFile.__doc__ = """File in a remote managed folder
+
+:param path: Path of the file within the folder, e.g. "/unet/config.json"
+:type path: str
+:param size: Size of the file in bytes
+:type size: int
+:param last_modified: Last modification time of the file, in
+    milliseconds since the epoch
+:type last_modified: int | None
+:param local_path: Path that the file is downloaded to, relative to
+    the local dir. If `None`, `path` is used
+:type local_path: str | None
+"""
 
 
 def get_file_path_or_temp(folder):
@@ -38,9 +67,81 @@ def get_file_path_or_temp(folder):
     return pathlib.Path(file_path), temp_dir
 
 
-def download_folder(remote_folder, local_path):
+def get_file_path_or_cache(folder, cache, list_files=None):
+    """Attempt to get the local path to a folder
+
+    If the folder isn't on the local filesystem, an entry of the local
+    weights cache will be acquired instead. The caller must download
+    the folder to the entry if it isn't complete yet
+
+    :param folder: The folder to get the local path to
+    :type folder: Dataiku.folder
+    :param cache: Local weights cache
+    :type cache: ai_art.cache.WeightsCache
+    :param list_files: Function that lists the files of the folder that
+        need to be cached. If `None`, all files are cached
+    :type list_files: Callable[[Dataiku.folder], list[RemoteFile]] | None
+
+    :return: Path to the local folder, and the cache entry if one was
+        acquired
+    :rtype: tuple[pathlib.Path, ai_art.cache.WeightsCacheEntry | None]
+    """
+    try:
+        file_path = folder.get_path()
+    except Exception:
+        logging.warning(
+            "Unable to access the folder %r directly because it's not on the "
+            "local filesystem. The contents of the folder will be copied to "
+            "the local weights cache",
+            folder.name,
+        )
+        if list_files is None:
+            list_files = list_remote_files
+
+        entry = cache.acquire(folder, list_files(folder))
+        return entry.path, entry
+
+    return pathlib.Path(file_path), None
+
+
+def list_remote_files(remote_folder):
+    """List the files of a managed folder, along with their metadata
+
+    :param remote_folder: Managed folder to list
+    :type remote_folder: Dataiku.folder
+
+    :return: Files of the folder, sorted by path
+    :rtype: list[RemoteFile]
+    """
+    remote_files = []
+    for remote_path in sorted(remote_folder.list_paths_in_partition()):
+        details = remote_folder.get_path_details(remote_path)
+        remote_files.append(
+            RemoteFile(
+                path=remote_path,
+                size=details.get("size", 0),
+                last_modified=details.get("lastModified"),
+            )
+        )
+
+    return remote_files
+
+
+def download_folder(
+    remote_folder,
+    local_path,
+    *,
+    max_workers=4,
+    remote_files=None,
+    on_file_downloaded=None,
+):
     """Download the contents of a managed folder to a local directory
 
+    Files are downloaded in parallel, largest first. Each file is
+    written to a ".part" file that is renamed once it's complete, so if
+    the download is interrupted, calling this function again only
+    downloads the files that weren't completed
+
     Empty directories are skipped
 
     :param remote_folder: Managed folder that will be downloaded
@@ -48,16 +149,298 @@ def download_folder(remote_folder, local_path):
     :param local_path: Path to the local dir that ``remote_folder`` will
         be downloaded to
     :type local_path: pathlib.Path
+    :param max_workers: Number of files to download at once
+    :type max_workers: int
+    :param remote_files: Files of ``remote_folder``. If `None`, the
+        folder will be listed
+    :type remote_files: Iterable[RemoteFile] | None
+    :param on_file_downloaded: Function that's called with each file
+        once it's available locally, including the files that were
+        already downloaded
+    :type on_file_downloaded: Callable[[RemoteFile], None] | None
+
+    :return: Number of bytes that were downloaded
+    :rtype: int
+    """
+    if remote_files is None:
+        remote_files = list_remote_files(remote_folder)
+
+    pending_files = []
+    for remote_file in remote_files:
+        full_local_path = _get_full_local_path(local_path, remote_file)
+        if _is_downloaded(full_local_path, remote_file):
+            logging.info("Already downloaded: %s", remote_file.path)
+            if on_file_downloaded is not None:
+                on_file_downloaded(remote_file)
+        else:
+            pending_files.append(remote_file)
+
+    # Start with the largest files so that they don't end up being
+    # downloaded alone at the end
+    pending_files.sort(key=lambda remote_file: remote_file.size, reverse=True)
+
+    start_time = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = {
+            executor.submit(
+                _download_file,
+                remote_folder,
+                remote_file,
+                _get_full_local_path(local_path, remote_file),
+            ): remote_file
+            for remote_file in pending_files
+        }
+        downloaded_size = 0
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                downloaded_size += future.result()
+                if on_file_downloaded is not None:
+                    on_file_downloaded(futures[future])
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    elapsed_time = time.perf_counter() - start_time
+    downloaded_megabytes = downloaded_size / 1024**2
+    logging.info(
+        "Downloaded %s files (%.1f MB) in %.1f s (%.1f MB/s)",
+        len(pending_files),
+        downloaded_megabytes,
+        elapsed_time,
+        downloaded_megabytes / elapsed_time if elapsed_time else 0.0,
+    )
+
+    return downloaded_size
+
+
+def upload_folder(local_path, remote_folder):
+    """Upload the contents of a local directory to a managed folder
+
+    :param local_path: Path to the local dir that will be uploaded
+    :type local_path: pathlib.Path
+    :param remote_folder: Managed folder that ``local_path`` will be
+        uploaded to
+    :type remote_folder: Dataiku.folder
 
     :return: None
     """
-    for remote_path in remote_folder.list_paths_in_partition():
-        rel_path = remote_path.lstrip("/")
-        full_local_path = local_path / rel_path
+    for full_local_path in sorted(local_path.rglob("*")):
+        if not full_local_path.is_file():
+            continue
+
+        remote_path = full_local_path.relative_to(local_path).as_posix()
+        logging.info("Uploading: %s", remote_path)
+        with open(full_local_path, "rb") as local_file:
+            with remote_folder.get_writer(remote_path) as remote_file:
+                shutil.copyfileobj(local_file, remote_file, _CHUNK_SIZE)
+
+
+class FolderDownload:
+    """Download a managed folder in a background thread
+
+    Consumers can wait for a subset of the files with `wait_for()`, so
+    that they can start using them while the rest of the folder is
+    being downloaded
+    """
+
+    __slots__ = (
+        "_remote_folder",
+        "_local_path",
+        "_max_workers",
+        "_remote_files",
+        "_pending_paths",
+        "_condition",
+        "_thread",
+        "_error",
+        "_downloaded_size",
+    )
+
+    def __init__(
+        self, remote_folder, local_path, *, max_workers=4, remote_files=None
+    ):
+        """
+        :param remote_folder: Managed folder that will be downloaded
+        :type remote_folder: Dataiku.folder
+        :param local_path: Path to the local dir that ``remote_folder``
+            will be downloaded to
+        :type local_path: pathlib.Path
+        :param max_workers: Number of files to download at once
+        :type max_workers: int
+        :param remote_files: Files of ``remote_folder``. If `None`, the
+            folder will be listed
+        :type remote_files: Iterable[RemoteFile] | None
+
+        :return: None
+        """
+        if remote_files is None:
+            remote_files = list_remote_files(remote_folder)
+
+        self._remote_folder = remote_folder
+        self._local_path = local_path
+        self._max_workers = max_workers
+        self._remote_files = list(remote_files)
+        self._pending_paths = {
+            _get_rel_local_path(remote_file)
+            for remote_file in self._remote_files
+        }
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="weights-download", daemon=True
+        )
+        self._error = None
+        self._downloaded_size = None
+
+    def start(self):
+        """Start downloading the folder in the background
+
+        :return: None
+        """
+        self._thread.start()
+
+    def _run(self):
+        """Download the folder. Run by the background thread"""
+        try:
+            downloaded_size = download_folder(
+                self._remote_folder,
+                self._local_path,
+                max_workers=self._max_workers,
+                remote_files=self._remote_files,
+                on_file_downloaded=self._on_file_downloaded,
+            )
+        except BaseException as error:
+            with self._condition:
+                self._error = error
+                self._condition.notify_all()
+        else:
+            with self._condition:
+                self._downloaded_size = downloaded_size
+                self._condition.notify_all()
+
+    def _on_file_downloaded(self, remote_file):
+        """Mark a file as downloaded and wake up the waiting consumers"""
+        with self._condition:
+            self._pending_paths.discard(_get_rel_local_path(remote_file))
+            self._condition.notify_all()
+
+    def _is_pending(self, rel_path):
+        """Check whether a file or dir still has files to download
+
+        :param rel_path: Path relative to the local dir, e.g. "unet" or
+            "model_index.json"
+        :type rel_path: str
+
+        :rtype: bool
+        """
+        prefix = f"{rel_path}/"
+        return any(
+            (pending_path == rel_path) or pending_path.startswith(prefix)
+            for pending_path in self._pending_paths
+        )
+
+    def wait_for(self, rel_path):
+        """Wait until a file, or all files of a dir, are downloaded
+
+        :param rel_path: Path relative to the local dir, e.g. "unet" or
+            "model_index.json"
+        :type rel_path: str
+
+        :raises Exception: If the download failed
+
+        :return: None
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._error is not None
+                or not self._is_pending(rel_path)
+            )
+            if self._error is not None:
+                raise self._error
+
+    def wait(self):
+        """Wait until the whole folder is downloaded
+
+        :raises Exception: If the download failed
+
+        :return: Number of bytes that were downloaded
+        :rtype: int
+        """
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+        return self._downloaded_size
+
+
+def _get_rel_local_path(remote_file):
+    """Get the path that a remote file will be downloaded to, relative
+    to the local dir
+
+    :param remote_file: Remote file
+    :type remote_file: RemoteFile
+
+    :return: Relative POSIX path of the file, e.g. "unet/config.json"
+    :rtype: str
+    """
+    return (remote_file.local_path or remote_file.path).lstrip("/")
+
+
+def _get_full_local_path(local_path, remote_file):
+    """Get the local path that a remote file will be downloaded to
+
+    :param local_path: Path to the local dir that the folder will be
+        downloaded to
+    :type local_path: pathlib.Path
+    :param remote_file: Remote file
+    :type remote_file: RemoteFile
+
+    :return: Local path of the file
+    :rtype: pathlib.Path
+    """
+    return local_path / _get_rel_local_path(remote_file)
+
+
+def _is_downloaded(full_local_path, remote_file):
+    """Check whether a remote file was already downloaded
+
+    :param full_local_path: Local path of the file
+    :type full_local_path: pathlib.Path
+    :param remote_file: Remote file
+    :type remote_file: RemoteFile
+
+    :return: Whether the local file exists and is complete
+    :rtype: bool
+    """
+    try:
+        local_size = full_local_path.stat().st_size
+    except FileNotFoundError:
+        return False
+
+    return local_size == remote_file.size
+
+
+def _download_file(remote_folder, remote_file, full_local_path):
+    """Download a single file from a managed folder
+
+    :param remote_folder: Managed folder that contains the file
+    :type remote_folder: Dataiku.folder
+    :param remote_file: File to download
+    :type remote_file: RemoteFile
+    :param full_local_path: Local path that the file will be downloaded
+        to
+    :type full_local_path: pathlib.Path
+
+    :return: Number of bytes that were downloaded
+    :rtype: int
+    """
+    # Create parent dirs
+    full_local_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = full_local_path.with_name(full_local_path.name + _PART_SUFFIX)
 
-        # Create parent dirs
-        full_local_path.parent.mkdir(parents=True, exist_ok=True)
+    logging.info("Downloading: %s", remote_file.path)
+    with remote_folder.get_download_stream(remote_file.path) as remote_stream:
+        with open(part_path, "wb") as local_file:
+            shutil.copyfileobj(remote_stream, local_file, _CHUNK_SIZE)
 
-        with remote_folder.get_download_stream(remote_path) as remote_file:
-            with open(full_local_path, "wb") as local_file:
-                shutil.copyfileobj(remote_file, local_file)
+    os.replace(part_path, full_local_path)
+    return full_local_path.stat().st_size
@@ -1,15 +1,104 @@
 import abc
+import concurrent.futures
+import copy
 import logging
 import math
+import pathlib
+import queue
+import threading
+import time
 
+import numpy as np
 import torch
-from diffusers import StableDiffusionImg2ImgPipeline, StableDiffusionPipeline
+from diffusers import (
+    SchedulerMixin,
+    StableDiffusionImg2ImgPipeline,
+    StableDiffusionPipeline,
+)
+
+from ai_art.components import get_component_store
+from ai_art.convert import MANIFEST_FILENAME
+from ai_art.loading import MODEL_INDEX_FILENAME, load_pipeline_components
+from ai_art.memory import PeakRssSampler, log_peak_rss
+from ai_art.registry import get_pipeline_registry, make_pipeline_key
+
+# Number of batches that each device may generate ahead of the batch
+# that's being consumed, when generating on multiple devices
+_BATCHES_AHEAD_PER_DEVICE = 2
+
+
+def derive_seed(random_seed, index):
+    """Derive an independent seed from a random seed and an index
+
+    :param random_seed: Random seed of the run
+    :type random_seed: int
+    :param index: Index of the batch or image that the seed is for
+    :type index: int
+
+    :return: Derived seed
+    :rtype: int
+    """
+    seed_sequence = np.random.SeedSequence([random_seed, index])
+    # PyTorch seeds must fit in a signed 64-bit integer
+    return int(seed_sequence.generate_state(1, np.uint64)[0] >> 1)
+
+
+def _copy_pipeline(pipe, pipeline_class=None, device=None):
+    """Create a pipeline from the components of another pipeline
+
+    The scheduler is always copied, since it holds the state of the
+    denoising loop
+
+    :param pipe: Pipeline to copy
+    :type pipe: diffusers.DiffusionPipeline
+    :param pipeline_class: Class of the new pipeline. If `None`, the
+        class of `pipe` is used
+    :type pipeline_class: type[diffusers.DiffusionPipeline] | None
+    :param device: Device to copy the models to. If `None`, the models
+        are shared with `pipe` instead of being copied
+    :type device: torch.device | None
+
+    :return: New pipeline
+    :rtype: diffusers.DiffusionPipeline
+    """
+    if pipeline_class is None:
+        pipeline_class = type(pipe)
+
+    components = {}
+    for name, component in pipe.components.items():
+        if isinstance(component, torch.nn.Module) and (device is not None):
+            # Copy the models one at a time to limit the extra memory
+            # that's used on the source device
+            component = copy.deepcopy(component).to(device)
+        elif isinstance(component, SchedulerMixin):
+            component = type(component).from_config(component.config)
+        components[name] = component
+
+    return pipeline_class(
+        **components,
+        requires_safety_checker=pipe.config.get(
+            "requires_safety_checker", True
+        ),
+    )
 
 
 class _BaseImageGenerator(abc.ABC):
-    """Abstract base class used by the image-generator classes"""
+    """Abstract base class used by the image-generator classes
 
-    __slots__ = ("_pipe", "_device")
+    Subclasses must set the `_pipeline_class` class attribute to the
+    Diffusers pipeline class that they use
+
+    Loaded pipelines are kept in the default pipeline registry (see
+    `ai_art.registry`), so that generators that are created later in
+    the same process with the same weights and settings reuse them.
+    Their models are also kept in the default component store (see
+    `ai_art.components`), so that pipelines whose weights folders
+    contain identical files share them
+    """
+
+    __slots__ = ("_pipe", "_device", "_pipeline_key", "_replicas")
+
+    _pipeline_class = None
 
     def __init__(
         self,
@@ -18,6 +107,10 @@ class _BaseImageGenerator(abc.ABC):
         device_id=None,
         torch_dtype=None,
         enable_attention_slicing=False,
+        weights_download=None,
+        parallel_loading=False,
+        low_cpu_mem_usage=False,
+        reuse_pipeline=True,
     ):
         """
         :param weights_path: Path to a local folder that contains the
@@ -25,8 +118,10 @@ class _BaseImageGenerator(abc.ABC):
         :type weights_path: str | os.PathLike
         :param device_id: PyTorch device id, e.g "cuda:0". If `None`,
             the default CUDA device will be used if available; otherwise
-            the CPU will be used
-        :type device_id: str | None
+            the CPU will be used. If it's a list of device IDs, the
+            pipeline is loaded on the first device and replicated on the
+            others, and the batches are spread across all of them
+        :type device_id: str | Sequence[str] | None
         :param torch_dtype: Override the default `torch.dtype` and load
             the model under this dtype. This has no effect if running on
             the CPU (float32 will always be used because the CPU doesn't
@@ -35,10 +130,36 @@ class _BaseImageGenerator(abc.ABC):
         :param enable_attention_slicing: Enable sliced attention
             computation when generating the images
         :type enable_attention_slicing: bool
+        :param weights_download: Download of the weights folder that's
+            still in progress, if any. The weights are loaded once they
+            are downloaded
+        :type weights_download: ai_art.folder.FolderDownload | None
+        :param parallel_loading: Load the pipeline components (UNet,
+            VAE, text encoder, etc.) in parallel. If `weights_download`
+            is set, each component is loaded as soon as its files are
+            downloaded
+        :type parallel_loading: bool
+        :param low_cpu_mem_usage: Instantiate the models on the meta
+            device and place their weights directly on the target
+            device, so that the host never holds more than one copy of
+            the weights
+        :type low_cpu_mem_usage: bool
+        :param reuse_pipeline: Reuse a pipeline that's already loaded
+            in this process with the same weights and settings, and make
+            the loaded pipeline available to later generators. Models
+            whose files are identical to a loaded model are also reused.
+            The pipeline registry is skipped if `weights_download` is set
+        :type reuse_pipeline: bool
 
         :return: None
         """
+        if isinstance(device_id, (list, tuple)):
+            device_id, *replica_device_ids = device_id
+        else:
+            replica_device_ids = []
+
         self._init_device(device_id)
+        self._replicas = []
 
         # Running the pipeline will fail if half precison is enabled
         # when using the CPU
@@ -50,12 +171,119 @@ class _BaseImageGenerator(abc.ABC):
                 )
             torch_dtype = torch.float32
 
+        self._pipe = None
+        self._pipeline_key = None
+        if reuse_pipeline and (weights_download is None):
+            self._pipeline_key = make_pipeline_key(
+                self._pipeline_class,
+                weights_path,
+                torch_dtype=torch_dtype,
+                device=self._device,
+                enable_attention_slicing=enable_attention_slicing,
+            )
+            self._pipe = get_pipeline_registry().get(self._pipeline_key)
+
+        if self._pipe is not None:
+            logging.info("Reusing the pipeline that's already loaded")
+        else:
+            self._load_pipe(
+                weights_path,
+                torch_dtype,
+                enable_attention_slicing=enable_attention_slicing,
+                weights_download=weights_download,
+                parallel_loading=parallel_loading,
+                low_cpu_mem_usage=low_cpu_mem_usage,
+                reuse_pipeline=reuse_pipeline,
+            )
+
+        for replica_device_id in replica_device_ids:
+            replica_device = torch.device(replica_device_id)
+            logging.info("Replicating the pipeline on %s", replica_device)
+            replica = _copy_pipeline(self._pipe, device=replica_device)
+            self._replicas.append((replica_device, replica))
+
+    def _load_pipe(
+        self,
+        weights_path,
+        torch_dtype,
+        *,
+        enable_attention_slicing,
+        weights_download,
+        parallel_loading,
+        low_cpu_mem_usage,
+        reuse_pipeline,
+    ):
+        """Load the pipeline and add it to the pipeline registry
+
+        See `__init__()` for the params
+
+        :return: None
+        """
         logging.info("Loading weights")
-        self._init_pipe(weights_path, torch_dtype)
+        start_time = time.perf_counter()
+        with PeakRssSampler() as sampler:
+            self._init_pipe(
+                weights_path,
+                torch_dtype,
+                weights_download=weights_download,
+                parallel_loading=parallel_loading,
+                low_cpu_mem_usage=low_cpu_mem_usage,
+                share_components=reuse_pipeline,
+            )
+        logging.info(
+            "Loaded weights in %.1f s", time.perf_counter() - start_time
+        )
+        log_peak_rss("loading the weights", sampler)
 
         if enable_attention_slicing:
             self._pipe.enable_attention_slicing()
 
+        if self._pipeline_key is not None:
+            get_pipeline_registry().add(self._pipeline_key, self._pipe)
+
+    def release(self):
+        """Release the pipeline so that its memory can be freed
+
+        The pipeline is removed from the pipeline registry, and the
+        generator can't be used anymore
+
+        :return: None
+        """
+        self._pipe = None
+        self._replicas = []
+        if self._pipeline_key is not None:
+            get_pipeline_registry().release(self._pipeline_key)
+
+    @classmethod
+    def from_generator(cls, generator):
+        """Create a generator that shares the pipeline of another one
+
+        The new generator uses the same models (UNet, VAE, text
+        encoder, etc.) and devices as `generator`, so no weights are
+        loaded or copied. Only the scheduler is copied, since it holds
+        the state of the denoising loop. For example::
+
+            text_to_image = TextToImage(weights_path)
+            image_to_image = TextGuidedImageToImage.from_generator(
+                text_to_image
+            )
+
+        :param generator: Generator whose pipeline is shared
+        :type generator: _BaseImageGenerator
+
+        :return: New generator
+        :rtype: _BaseImageGenerator
+        """
+        self = cls.__new__(cls)
+        self._device = generator._device
+        self._pipeline_key = None
+        self._pipe = _copy_pipeline(generator._pipe, cls._pipeline_class)
+        self._replicas = [
+            (device, _copy_pipeline(replica, cls._pipeline_class))
+            for device, replica in generator._replicas
+        ]
+        return self
+
     def _init_device(self, device_id):
         """Load the PyTorch device
 
@@ -79,11 +307,19 @@ class _BaseImageGenerator(abc.ABC):
             logging.info("Using device: %s", device_id)
             self._device = torch.device(device_id)
 
-    @abc.abstractmethod
-    def _init_pipe(self, weights_path, torch_dtype):
+    def _init_pipe(
+        self,
+        weights_path,
+        torch_dtype,
+        *,
+        weights_download=None,
+        parallel_loading=False,
+        low_cpu_mem_usage=False,
+        share_components=False,
+    ):
         """Load the pipeline from the pretrained weights
 
-        The pipeline must be assigned to the `_pipe` attribute
+        The pipeline is assigned to the `_pipe` attribute
 
         :param weights_path: Path to a local folder that contains the
             Stable Diffusion weights
@@ -91,10 +327,65 @@ class _BaseImageGenerator(abc.ABC):
         :param torch_dtype: Override the default `torch.dtype` and load
             the model under this dtype
         :type torch_dtype: torch.dtype | None
+        :param weights_download: Download of the weights folder that's
+            still in progress, if any
+        :type weights_download: ai_art.folder.FolderDownload | None
+        :param parallel_loading: Load the pipeline components in
+            parallel
+        :type parallel_loading: bool
+        :param low_cpu_mem_usage: Place the weights of the models
+            directly on the device while they're loaded
+        :type low_cpu_mem_usage: bool
+        :param share_components: Reuse the models that are already
+            loaded with identical files, and make the loaded models
+            available to other pipelines
+        :type share_components: bool
 
         :return: None
         """
-        ...
+        if (pathlib.Path(weights_path) / MANIFEST_FILENAME).exists():
+            # Diffusers and Transformers load safetensors files instead
+            # of pickled files when both are available
+            logging.info(
+                "Loading optimized weights. The safetensors files will be "
+                "memory-mapped"
+            )
+
+        # Sharing the components requires loading them one by one. This
+        # isn't possible if the weights folder has no model index, in
+        # which case `from_pretrained()` fails anyway
+        share_components = (
+            share_components
+            and (weights_download is None)
+            and (pathlib.Path(weights_path) / MODEL_INDEX_FILENAME).exists()
+        )
+
+        if parallel_loading or low_cpu_mem_usage or share_components:
+            components = load_pipeline_components(
+                self._pipeline_class,
+                weights_path,
+                torch_dtype=torch_dtype,
+                weights_download=weights_download,
+                # Loading the components one at a time keeps the peak
+                # memory usage to the size of the largest one
+                max_workers=None if parallel_loading else 1,
+                device=self._device,
+                low_cpu_mem_usage=low_cpu_mem_usage,
+                component_store=(
+                    get_component_store() if share_components else None
+                ),
+            )
+        else:
+            if weights_download is not None:
+                weights_download.wait()
+            components = {}
+
+        # The components that were already loaded are passed to the
+        # pipeline as-is
+        pipe = self._pipeline_class.from_pretrained(
+            weights_path, torch_dtype=torch_dtype, **components
+        )
+        self._pipe = pipe.to(self._device)
 
     @abc.abstractmethod
     def generate_images(self):
@@ -113,23 +404,28 @@ class _BaseImageGenerator(abc.ABC):
         """
         ...
 
-    def _generate_image_batch(self, use_autocast, **kwargs):
+    def _generate_image_batch(self, use_autocast, *, pipe=None, **kwargs):
         """Generate a single batch of images
 
         :param use_autocast: Use `torch.autocast` when possible. Only
             available for CUDA devices
         :type use_autocast: bool
-        :param kwargs: kwargs to pass to `_pipe()`
+        :param pipe: Pipeline to call. If `None`, `_pipe` is used
+        :type pipe: diffusers.DiffusionPipeline | None
+        :param kwargs: kwargs to pass to the pipeline
         :type kwargs: Any
 
         :return: List of images that were generated
         :rtype: list[PIL.Image.Image]
         """
+        if pipe is None:
+            pipe = self._pipe
+
         if use_autocast:
             with torch.autocast(self._device.type):
-                output = self._pipe(**kwargs)
+                output = pipe(**kwargs)
         else:
-            output = self._pipe(**kwargs)
+            output = pipe(**kwargs)
 
         return output.images
 
@@ -152,6 +448,14 @@ class _BaseImageGenerator(abc.ABC):
         :param kwargs: kwargs to pass to `_pipe()`
         :type kwargs: Any
 
+        If the pipeline is replicated on several devices, the batches are
+        generated in parallel. Each device takes the next batch as soon
+        as it's done with the previous one, and the images are yielded
+        in the same order as with a single device. Each batch then uses
+        its own random generator, seeded from `random_seed` and the
+        index of the batch, so that the images don't depend on which
+        device generated them
+
         :return: Generator of images that were generated
         :rtype: Generator[PIL.Image.Image, None, None]
         """
@@ -176,6 +480,21 @@ class _BaseImageGenerator(abc.ABC):
             logging.info("autocast is disabled")
             use_autocast = False
 
+        batch_sizes = []
+        for _ in range(batch_count):
+            if image_processed_count + batch_size > image_count:
+                current_batch_size = image_count - image_processed_count
+            else:
+                current_batch_size = batch_size
+            batch_sizes.append(current_batch_size)
+            image_processed_count += current_batch_size
+
+        if self._replicas:
+            yield from self._generate_image_batches_in_parallel(
+                batch_sizes, use_autocast, random_seed, kwargs
+            )
+            return
+
         if random_seed is None:
             # Set the generator to `None` so that PyTorch generates a
             # random seed for us
@@ -184,12 +503,7 @@ class _BaseImageGenerator(abc.ABC):
             generator = torch.Generator(self._device)
             generator = generator.manual_seed(random_seed)
 
-        for i in range(batch_count):
-            if image_processed_count + batch_size > image_count:
-                current_batch_size = image_count - image_processed_count
-            else:
-                current_batch_size = batch_size
-
+        for i, current_batch_size in enumerate(batch_sizes):
             logging.info("Generating batch %s", i + 1)
             images = self._generate_image_batch(
                 use_autocast=use_autocast,
@@ -197,19 +511,107 @@ class _BaseImageGenerator(abc.ABC):
                 generator=generator,
                 **kwargs,
             )
-
-            image_processed_count += current_batch_size
             yield from images
 
+    def _generate_image_batches_in_parallel(
+        self, batch_sizes, use_autocast, random_seed, kwargs
+    ):
+        """Generate batches of images on all the devices at once
+
+        Each device runs in its own thread and takes the next pending
+        batch once it's done with its current batch. Devices can't get
+        more than a few batches ahead of the batch that's being yielded
+
+        :param batch_sizes: Size of each batch
+        :type batch_sizes: list[int]
+        :param use_autocast: Use `torch.autocast`
+        :type use_autocast: bool
+        :param random_seed: Random seed that's used to generate the
+            images
+        :type random_seed: int | None
+        :param kwargs: kwargs to pass to the pipelines
+        :type kwargs: dict[str, Any]
+
+        :return: Generator of images, in batch order
+        :rtype: Generator[PIL.Image.Image, None, None]
+        """
+        pipes = [(self._device, self._pipe), *self._replicas]
+        logging.info("Generating on %s devices", len(pipes))
+
+        pending_batches = queue.SimpleQueue()
+        for i in range(len(batch_sizes)):
+            pending_batches.put(i)
+        futures = [concurrent.futures.Future() for _ in batch_sizes]
+        free_slots = threading.Semaphore(
+            _BATCHES_AHEAD_PER_DEVICE * len(pipes)
+        )
+        stop_event = threading.Event()
+
+        def run_device(device, pipe):
+            while not stop_event.is_set():
+                if not free_slots.acquire(timeout=0.1):
+                    continue
+
+                try:
+                    i = pending_batches.get_nowait()
+                except queue.Empty:
+                    return
+
+                future = futures[i]
+                if not future.set_running_or_notify_cancel():
+                    return
+
+                if random_seed is None:
+                    generator = None
+                else:
+                    generator = torch.Generator(device)
+                    generator = generator.manual_seed(
+                        derive_seed(random_seed, i)
+                    )
+
+                logging.info("Generating batch %s on %s", i + 1, device)
+                try:
+                    images = self._generate_image_batch(
+                        use_autocast=use_autocast,
+                        pipe=pipe,
+                        num_images_per_prompt=batch_sizes[i],
+                        generator=generator,
+                        **kwargs,
+                    )
+                except BaseException as error:
+                    future.set_exception(error)
+                    return
+                future.set_result(images)
+
+        threads = [
+            threading.Thread(
+                target=run_device,
+                args=(device, pipe),
+                name=f"generate-{device}",
+                daemon=True,
+            )
+            for device, pipe in pipes
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for future in futures:
+                images = future.result()
+                free_slots.release()
+                yield from images
+        finally:
+            stop_event.set()
+            for future in futures:
+                future.cancel()
+            for thread in threads:
+                thread.join()
+
 
 class TextToImage(_BaseImageGenerator):
     """Generate images from a text prompt"""
 
-    def _init_pipe(self, weights_path, torch_dtype):
-        pipe = StableDiffusionPipeline.from_pretrained(
-            weights_path, torch_dtype=torch_dtype
-        )
-        self._pipe = pipe.to(self._device)
+    _pipeline_class = StableDiffusionPipeline
 
     def generate_images(
         self,
@@ -273,11 +675,7 @@ class TextToImage(_BaseImageGenerator):
 class TextGuidedImageToImage(_BaseImageGenerator):
     """Generate images from a base image, guided by a text prompt"""
 
-    def _init_pipe(self, weights_path, torch_dtype):
-        pipe = StableDiffusionImg2ImgPipeline.from_pretrained(
-            weights_path, torch_dtype=torch_dtype
-        )
-        self._pipe = pipe.to(self._device)
+    _pipeline_class = StableDiffusionImg2ImgPipeline
 
     def generate_images(
         self,
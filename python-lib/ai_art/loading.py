@@ -0,0 +1,360 @@
+import concurrent.futures
+import importlib
+import json
+import logging
+import pathlib
+import time
+
+import diffusers
+import safetensors.torch
+import torch
+import transformers
+from diffusers.utils import is_accelerate_available, is_safetensors_available
+
+from ai_art.weights import get_pipeline_components
+
+MODEL_INDEX_FILENAME = "model_index.json"
+
+# Single-file weights that each library loads, in order of preference
+_WEIGHTS_FILENAMES = {
+    "safetensors": (
+        "diffusion_pytorch_model.safetensors",
+        "model.safetensors",
+    ),
+    "bin": ("diffusion_pytorch_model.bin", "pytorch_model.bin"),
+}
+
+
+def _get_component_class(library_name, class_name):
+    """Get the class of a pipeline component
+
+    :param library_name: Library of the component, as written in
+        "model_index.json", e.g. "transformers" or "stable_diffusion"
+    :type library_name: str
+    :param class_name: Class of the component, e.g. "CLIPTextModel"
+    :type class_name: str
+
+    :return: Class of the component
+    :rtype: type
+    """
+    # Flax class names are also used for PyTorch weights
+    if class_name.startswith("Flax"):
+        class_name = class_name[4:]
+
+    # Some components are defined by a Diffusers pipeline module, e.g.
+    # the safety checker
+    if hasattr(diffusers.pipelines, library_name):
+        module = getattr(diffusers.pipelines, library_name)
+    else:
+        module = importlib.import_module(library_name)
+
+    return getattr(module, class_name)
+
+
+def _find_weights_file(component_path):
+    """Find the single weights file of a component
+
+    :param component_path: Path to the component's subfolder
+    :type component_path: pathlib.Path
+
+    :return: Path to the weights file, or `None` if the weights are
+        sharded or missing
+    :rtype: pathlib.Path | None
+    """
+    formats = ["bin"]
+    if is_safetensors_available():
+        formats.insert(0, "safetensors")
+
+    for weights_format in formats:
+        for filename in _WEIGHTS_FILENAMES[weights_format]:
+            path = component_path / filename
+            if path.is_file():
+                return path
+
+    return None
+
+
+def _load_state_dict(path, device):
+    """Load a state dict directly on a device
+
+    :param path: Path to the pickled or safetensors file
+    :type path: pathlib.Path
+    :param device: Device to load the tensors on
+    :type device: torch.device
+
+    :return: State dict
+    :rtype: dict[str, torch.Tensor]
+    """
+    if path.suffix == ".safetensors":
+        return safetensors.torch.load_file(str(path), device=str(device))
+    else:
+        return torch.load(path, map_location=device)
+
+
+def _instantiate_empty_model(component_class, component_path):
+    """Instantiate a model on the meta device, without allocating or
+    initializing its weights
+
+    :param component_class: Diffusers or Transformers model class
+    :type component_class: type
+    :param component_path: Path to the component's subfolder
+    :type component_path: pathlib.Path
+
+    :return: Model whose parameters are on the meta device
+    :rtype: torch.nn.Module
+    """
+    import accelerate
+
+    with accelerate.init_empty_weights():
+        if issubclass(component_class, diffusers.ModelMixin):
+            config = component_class.load_config(component_path)
+            return component_class.from_config(config)
+        else:
+            config = component_class.config_class.from_pretrained(
+                component_path
+            )
+            return component_class(config)
+
+
+def _load_model_on_device(
+    component_class, component_path, torch_dtype, device
+):
+    """Load a model with its weights placed directly on a device
+
+    The model is instantiated on the meta device, then each tensor of
+    the state dict is loaded on `device`, cast to `torch_dtype`, and
+    assigned to the model. No randomly-initialized copy of the weights
+    is ever allocated on the host
+
+    :param component_class: Diffusers or Transformers model class
+    :type component_class: type
+    :param component_path: Path to the component's subfolder
+    :type component_path: pathlib.Path
+    :param torch_dtype: dtype to load the model under
+    :type torch_dtype: torch.dtype | None
+    :param device: Device to place the weights on
+    :type device: torch.device
+
+    :return: Loaded model, or `None` if the model can't be loaded this
+        way, e.g. because its weights are sharded
+    :rtype: torch.nn.Module | None
+    """
+    from accelerate.utils import set_module_tensor_to_device
+
+    weights_file = _find_weights_file(component_path)
+    if weights_file is None:
+        return None
+
+    model = _instantiate_empty_model(component_class, component_path)
+    state_dict = _load_state_dict(weights_file, device)
+
+    tensor_names = {name for name, _ in model.named_parameters()}
+    tensor_names.update(name for name, _ in model.named_buffers())
+    for name in list(state_dict):
+        tensor = state_dict.pop(name)
+        # Old checkpoints may contain tensors that the model doesn't use
+        # anymore
+        if name not in tensor_names:
+            continue
+        if (torch_dtype is not None) and tensor.is_floating_point():
+            tensor = tensor.to(torch_dtype)
+        set_module_tensor_to_device(model, name, device, value=tensor)
+
+    # Tensors that are missing from the state dict are left on the meta
+    # device. This happens with tied weights
+    for name, tensor in model.state_dict().items():
+        if tensor.is_meta:
+            logging.info(
+                "Tensor %r of %s isn't in %s",
+                name,
+                component_class.__name__,
+                weights_file.name,
+            )
+            return None
+
+    # Buffers that aren't in the state dict are created on the host
+    return model.to(device).eval()
+
+
+def _load_component(
+    weights_path,
+    name,
+    component_class,
+    torch_dtype,
+    weights_download,
+    device=None,
+    low_cpu_mem_usage=False,
+    component_store=None,
+):
+    """Load a single pipeline component from its subfolder
+
+    :param weights_path: Path to the local weights folder
+    :type weights_path: pathlib.Path
+    :param name: Name of the component, e.g. "unet"
+    :type name: str
+    :param component_class: Class of the component
+    :type component_class: type
+    :param torch_dtype: dtype to load the component under
+    :type torch_dtype: torch.dtype | None
+    :param weights_download: Download of the weights folder that's in
+        progress, if any. The component is loaded once its subfolder is
+        downloaded
+    :type weights_download: ai_art.folder.FolderDownload | None
+    :param device: Device to move the models to. If `None`, the models
+        are left on the CPU
+    :type device: torch.device | None
+    :param low_cpu_mem_usage: Place the weights of the models directly
+        on `device` while they're loaded
+    :type low_cpu_mem_usage: bool
+    :param component_store: Store to reuse the models from if they're
+        already loaded, and to add them to otherwise
+    :type component_store: ai_art.components.ComponentStore | None
+
+    :return: Loaded component
+    :rtype: Any
+    """
+    if weights_download is not None:
+        weights_download.wait_for(name)
+
+    component_path = weights_path / name
+    is_model = issubclass(component_class, torch.nn.Module)
+
+    store_key = None
+    if is_model and (component_store is not None):
+        store_key = component_store.make_key(
+            component_path, component_class, torch_dtype, device
+        )
+        component = component_store.get(store_key)
+        if component is not None:
+            logging.info("Reusing loaded component %r", name)
+            return component
+
+    start_time = time.perf_counter()
+
+    component = None
+    if (
+        low_cpu_mem_usage
+        and (device is not None)
+        and is_accelerate_available()
+        and issubclass(
+            component_class,
+            (diffusers.ModelMixin, transformers.PreTrainedModel),
+        )
+    ):
+        component = _load_model_on_device(
+            component_class, component_path, torch_dtype, device
+        )
+        if component is None:
+            logging.info(
+                "Can't load component %r directly on %s. Loading it on "
+                "the CPU instead",
+                name,
+                device,
+            )
+
+    if component is None:
+        loading_kwargs = {}
+        if is_model:
+            loading_kwargs["torch_dtype"] = torch_dtype
+            # Same as `DiffusionPipeline.from_pretrained()`: skip the
+            # random init of the weights, since they're overwritten
+            # anyway
+            loading_kwargs["low_cpu_mem_usage"] = is_accelerate_available()
+
+        component = component_class.from_pretrained(
+            component_path, **loading_kwargs
+        )
+
+    if is_model and (device is not None):
+        component = component.to(device)
+
+    logging.info(
+        "Loaded component %r in %.1f s",
+        name,
+        time.perf_counter() - start_time,
+    )
+
+    if store_key is not None:
+        component_store.add(store_key, component)
+
+    return component
+
+
+def load_pipeline_components(
+    pipeline_class,
+    weights_path,
+    *,
+    torch_dtype=None,
+    weights_download=None,
+    max_workers=None,
+    device=None,
+    low_cpu_mem_usage=False,
+    component_store=None,
+):
+    """Load the components of a pipeline in parallel
+
+    If the weights are still being downloaded, each component is loaded
+    as soon as its subfolder is complete. The components can then be
+    passed to `pipeline_class.from_pretrained()` to assemble the
+    pipeline without loading them again
+
+    :param pipeline_class: Diffusers pipeline class
+    :type pipeline_class: type[diffusers.DiffusionPipeline]
+    :param weights_path: Path to the local weights folder
+    :type weights_path: str | os.PathLike
+    :param torch_dtype: dtype to load the components under
+    :type torch_dtype: torch.dtype | None
+    :param weights_download: Download of the weights folder that's in
+        progress, if any
+    :type weights_download: ai_art.folder.FolderDownload | None
+    :param max_workers: Number of components to load at once. If
+        `None`, all components are loaded at once
+    :type max_workers: int | None
+    :param device: Device to move the models to. If `None`, the models
+        are left on the CPU
+    :type device: torch.device | None
+    :param low_cpu_mem_usage: Place the weights of the models directly
+        on `device` while they're loaded, so that they're never fully
+        copied on the host
+    :type low_cpu_mem_usage: bool
+    :param component_store: Store of loaded components. Models whose
+        files are identical to a model that's already in the store are
+        reused instead of being loaded again
+    :type component_store: ai_art.components.ComponentStore | None
+
+    :return: Loaded components, keyed by name
+    :rtype: dict[str, Any]
+    """
+    weights_path = pathlib.Path(weights_path)
+
+    if weights_download is not None:
+        weights_download.wait_for(MODEL_INDEX_FILENAME)
+    with open(weights_path / MODEL_INDEX_FILENAME) as file:
+        model_index = json.load(file)
+
+    components = get_pipeline_components(pipeline_class, model_index)
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers or len(components) or 1,
+        thread_name_prefix="component-loader",
+    ) as executor:
+        futures = {
+            name: executor.submit(
+                _load_component,
+                weights_path,
+                name,
+                _get_component_class(library_name, class_name),
+                torch_dtype,
+                weights_download,
+                device,
+                low_cpu_mem_usage,
+                component_store,
+            )
+            for name, (library_name, class_name) in components.items()
+        }
+        try:
+            return {name: future.result() for name, future in futures.items()}
+        except BaseException:
+            for future in futures.values():
+                future.cancel()
+            raise
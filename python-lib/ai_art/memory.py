@@ -0,0 +1,123 @@
+import logging
+import os
+import resource
+import sys
+import threading
+
+# Interval (in seconds) between two samples of the memory usage
+_SAMPLING_INTERVAL = 0.05
+
+
+def get_rss():
+    """Get the current resident set size (RSS) of the process
+
+    :return: RSS in bytes, or `None` if it isn't available on this
+        platform
+    :rtype: int | None
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            resident_pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def get_max_rss():
+    """Get the peak RSS of the process since it started
+
+    :return: Peak RSS in bytes
+    :rtype: int
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    if sys.platform == "darwin":
+        return max_rss
+    return max_rss * 1024
+
+
+class PeakRssSampler:
+    """Context manager that measures the peak RSS of a block of code
+
+    The RSS is sampled by a background thread, so short-lived spikes
+    may be missed. If the current RSS isn't available on this platform,
+    the peak RSS of the whole process is used instead
+
+    Example::
+
+        with PeakRssSampler() as sampler:
+            load_model()
+        print(sampler.peak_rss)
+    """
+
+    __slots__ = ("_peak_rss", "_stop_event", "_thread")
+
+    def __init__(self):
+        self._peak_rss = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="rss-sampler", daemon=True
+        )
+
+    @property
+    def peak_rss(self):
+        """Peak RSS in bytes
+
+        :rtype: int
+        """
+        return self._peak_rss
+
+    def _sample(self):
+        """Update the peak RSS with the current RSS"""
+        rss = get_rss()
+        if rss is None:
+            rss = get_max_rss()
+
+        if (self._peak_rss is None) or (rss > self._peak_rss):
+            self._peak_rss = rss
+
+    def _run(self):
+        """Sample the RSS until the block exits. Run by the thread"""
+        while not self._stop_event.wait(_SAMPLING_INTERVAL):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop_event.set()
+        self._thread.join()
+        self._sample()
+
+
+def format_bytes(size):
+    """Format a number of bytes for the logs
+
+    :param size: Number of bytes
+    :type size: int | None
+
+    :return: Formatted size, e.g. "1536.0 MB"
+    :rtype: str
+    """
+    if size is None:
+        return "unknown"
+    return f"{size / 1024**2:.1f} MB"
+
+
+def log_peak_rss(description, sampler):
+    """Log the peak RSS measured by a sampler
+
+    :param description: Description of the measured block, e.g.
+        "loading the weights"
+    :type description: str
+    :param sampler: Sampler that measured the block
+    :type sampler: PeakRssSampler
+
+    :return: None
+    """
+    logging.info(
+        "Peak RSS while %s: %s", description, format_bytes(sampler.peak_rss)
+    )
@@ -1,26 +1,40 @@
+import functools
 import logging
 
 import torch
+from diffusers import StableDiffusionImg2ImgPipeline, StableDiffusionPipeline
 
 from dku_config import DkuConfig
-from ai_art.folder import get_file_path_or_temp
+from ai_art.cache import WeightsCache
+from ai_art.folder import (
+    get_file_path_or_cache,
+    get_file_path_or_temp,
+    list_remote_files,
+)
 from ai_art.image import open_base_image
+from ai_art.weights import list_pipeline_files
 
 
 def _cast_device_id(device_id):
-    """Cast the `device_id` param to `None` if it's set to "auto"
+    """Cast the `device_id` param to `None` if it's set to "auto", or to
+    the list of CUDA devices if it's set to "all"
 
     `_BaseImageGenerator` will auto-detect the device if it's set to
-    `None`
+    `None`, and will spread the batches across the devices if it's set
+    to a list
 
     :param device_id: Device ID
     :type device_id: str | None
 
     :return: Casted device ID
-    :rtype: str | None
+    :rtype: str | list[str] | None
     """
     if device_id == "auto":
         device_id = None
+    elif device_id == "all":
+        device_id = [
+            f"cuda:{i}" for i in range(torch.cuda.device_count())
+        ] or None
     return device_id
 
 
@@ -62,7 +76,59 @@ def _cast_random_seed(random_seed):
         return None
 
 
-def _get_base_config(recipe_config, weights_folder, image_folder):
+def _get_weights_cache(recipe_config):
+    """Create the local weights cache, or `None` if it's disabled
+
+    :param recipe_config: Recipe config
+    :type recipe_config: Mapping[str, Any]
+
+    :return: Local weights cache
+    :rtype: ai_art.cache.WeightsCache | None
+    """
+    config = DkuConfig()
+    config.add_param(
+        name="use_weights_cache",
+        label="Cache weights",
+        value=recipe_config.get("use_weights_cache"),
+        default=True,
+    )
+    config.add_param(
+        name="weights_cache_dir",
+        label="Cache directory",
+        # DSS sets empty "STRING" params to an empty string
+        value=recipe_config.get("weights_cache_dir") or None,
+        required=False,
+    )
+    config.add_param(
+        name="weights_cache_max_size",
+        label="Cache size",
+        value=recipe_config.get("weights_cache_max_size"),
+        default=20.0,
+        cast_to=float,
+        checks=(
+            {
+                "type": "sup_eq",
+                "op": 0,
+            },
+        ),
+    )
+
+    if not config.use_weights_cache:
+        return None
+
+    if config.weights_cache_max_size:
+        # Convert from gigabytes to bytes
+        max_size = int(config.weights_cache_max_size * 1024**3)
+    else:
+        # No limit
+        max_size = None
+
+    return WeightsCache(config.weights_cache_dir, max_size=max_size)
+
+
+def _get_base_config(
+    recipe_config, weights_folder, image_folder, pipeline_class
+):
     """Create a DkuConfig instance that contains shared recipe params
 
     :param recipe_config: Recipe config
@@ -71,6 +137,9 @@ def _get_base_config(recipe_config, weights_folder, image_folder):
     :type weights_folder: dataiku.Folder
     :param image_folder: Output image_folder
     :type image_folder: dataiku.Folder
+    :param pipeline_class: Diffusers pipeline class that will load the
+        weights
+    :type pipeline_class: type[diffusers.DiffusionPipeline]
 
     :return: Created DkuConfig instance
     :rtype: dku_config.DkuConfig
@@ -79,8 +148,6 @@ def _get_base_config(recipe_config, weights_folder, image_folder):
     logging.info("Weights folder: %r", weights_folder.name)
     logging.info("Image folder: %r", image_folder.name)
 
-    weights_path, temp_weights_dir = get_file_path_or_temp(weights_folder)
-
     config = DkuConfig()
 
     config.add_param(
@@ -89,10 +156,6 @@ def _get_base_config(recipe_config, weights_folder, image_folder):
         value=weights_folder,
         required=True,
     )
-    config.add_param(name="weights_path", value=weights_path, required=True)
-    config.add_param(
-        name="temp_weights_dir", value=temp_weights_dir, required=False
-    )
     config.add_param(
         name="image_folder",
         label="Image folder",
@@ -138,6 +201,19 @@ def _get_base_config(recipe_config, weights_folder, image_folder):
         value=recipe_config.get("filename_prefix"),
         default="image-",
     )
+    config.add_param(
+        name="download_workers",
+        label="Download threads",
+        value=recipe_config.get("download_workers"),
+        default=4,
+        cast_to=int,
+        checks=(
+            {
+                "type": "sup_eq",
+                "op": 1,
+            },
+        ),
+    )
     config.add_param(
         name="device_id",
         label="CUDA device",
@@ -170,6 +246,12 @@ def _get_base_config(recipe_config, weights_folder, image_folder):
         value=recipe_config.get("enable_attention_slicing"),
         default=True,
     )
+    config.add_param(
+        name="low_memory_loading",
+        label="Low-memory loading",
+        value=recipe_config.get("low_memory_loading"),
+        default=True,
+    )
     config.add_param(
         name="random_seed",
         label="Random seed",
@@ -203,10 +285,74 @@ def _get_base_config(recipe_config, weights_folder, image_folder):
             },
         ),
     )
+    config.add_param(
+        name="selective_download",
+        label="Download only needed files",
+        value=recipe_config.get("selective_download"),
+        default=True,
+    )
+
+    _add_local_weights_params(config, recipe_config, pipeline_class)
 
     return config
 
 
+def _add_local_weights_params(config, recipe_config, pipeline_class):
+    """Add the params that describe the local copy of the weights
+
+    If the weights folder is remote, its files are listed and a local
+    dir (cache entry or temp dir) is created for them. The weights
+    aren't downloaded yet
+
+    :param config: Config that contains the base params
+    :type config: dku_config.DkuConfig
+    :param recipe_config: Recipe config
+    :type recipe_config: Mapping[str, Any]
+    :param pipeline_class: Diffusers pipeline class that will load the
+        weights
+    :type pipeline_class: type[diffusers.DiffusionPipeline]
+
+    :return: None
+    """
+    if config.selective_download:
+        list_files = functools.partial(
+            list_pipeline_files,
+            pipeline_class=pipeline_class,
+            torch_dtype=config.torch_dtype,
+        )
+    else:
+        list_files = list_remote_files
+
+    weights_cache = _get_weights_cache(recipe_config)
+    if weights_cache is None:
+        weights_path, temp_weights_dir = get_file_path_or_temp(
+            config.weights_folder
+        )
+        weights_cache_entry = None
+        if temp_weights_dir is None:
+            weights_files = None
+        else:
+            weights_files = list_files(config.weights_folder)
+    else:
+        weights_path, weights_cache_entry = get_file_path_or_cache(
+            config.weights_folder, weights_cache, list_files=list_files
+        )
+        temp_weights_dir = None
+        if weights_cache_entry is None:
+            weights_files = None
+        else:
+            weights_files = weights_cache_entry.remote_files
+
+    config.add_param(name="weights_path", value=weights_path, required=True)
+    config.add_param(
+        name="temp_weights_dir", value=temp_weights_dir, required=False
+    )
+    config.add_param(
+        name="weights_cache_entry", value=weights_cache_entry, required=False
+    )
+    config.add_param(name="weights_files", value=weights_files, required=False)
+
+
 def get_text_to_image_config(recipe_config, weights_folder, image_folder):
     """Create a DkuConfig instance that contains the TextToImage params
 
@@ -220,7 +366,9 @@ def get_text_to_image_config(recipe_config, weights_folder, image_folder):
     :return: Created DkuConfig instance
     :rtype: dku_config.DkuConfig
     """
-    config = _get_base_config(recipe_config, weights_folder, image_folder)
+    config = _get_base_config(
+        recipe_config, weights_folder, image_folder, StableDiffusionPipeline
+    )
 
     image_height = recipe_config.get("image_height")
     image_width = recipe_config.get("image_width")
@@ -288,7 +436,12 @@ def get_text_guided_image_to_image_config(
     :return: Created DkuConfig instance
     :rtype: dku_config.DkuConfig
     """
-    config = _get_base_config(recipe_config, weights_folder, image_folder)
+    config = _get_base_config(
+        recipe_config,
+        weights_folder,
+        image_folder,
+        StableDiffusionImg2ImgPipeline,
+    )
 
     logging.info("Base image folder: %r", base_image_folder.name)
 
@@ -345,3 +498,83 @@ def get_text_guided_image_to_image_config(
     config.add_param(name="base_image", value=base_image, required=True)
 
     return config
+
+
+def get_optimize_weights_config(
+    recipe_config, weights_folder, optimized_weights_folder
+):
+    """Create a DkuConfig instance that contains the params of the
+    weights-optimization recipe
+
+    :param recipe_config: Recipe config
+    :type recipe_config: Mapping[str, Any]
+    :param weights_folder: Input weights_folder
+    :type weights_folder: dataiku.Folder
+    :param optimized_weights_folder: Output optimized_weights_folder
+    :type optimized_weights_folder: dataiku.Folder
+
+    :return: Created DkuConfig instance
+    :rtype: dku_config.DkuConfig
+    """
+    logging.info("Recipe config: %r", recipe_config)
+    logging.info("Weights folder: %r", weights_folder.name)
+    logging.info("Optimized weights folder: %r", optimized_weights_folder.name)
+
+    config = DkuConfig()
+
+    config.add_param(
+        name="weights_folder",
+        label="Weights folder",
+        value=weights_folder,
+        required=True,
+    )
+    config.add_param(
+        name="optimized_weights_folder",
+        label="Optimized weights folder",
+        value=optimized_weights_folder,
+        required=True,
+    )
+    config.add_param(
+        name="torch_dtype",
+        label="Half precision",
+        value=recipe_config.get("use_half_precision"),
+        default=True,
+        cast_to=_cast_torch_dtype,
+    )
+    config.add_param(
+        name="clear_folder",
+        label="Clear folder",
+        value=recipe_config.get("clear_folder"),
+        default=True,
+    )
+    config.add_param(
+        name="download_workers",
+        label="Download threads",
+        value=recipe_config.get("download_workers"),
+        default=4,
+        cast_to=int,
+        checks=(
+            {
+                "type": "sup_eq",
+                "op": 1,
+            },
+        ),
+    )
+
+    weights_path, temp_weights_dir = get_file_path_or_temp(weights_folder)
+    if temp_weights_dir is None:
+        weights_files = None
+    else:
+        weights_files = list_pipeline_files(
+            weights_folder,
+            StableDiffusionPipeline,
+            torch_dtype=config.torch_dtype,
+        )
+
+    config.add_param(name="weights_path", value=weights_path, required=True)
+    config.add_param(
+        name="temp_weights_dir", value=temp_weights_dir, required=False
+    )
+    config.add_param(name="weights_files", value=weights_files, required=False)
+
+    return config
@@ -0,0 +1,206 @@
+import collections
+import gc
+import hashlib
+import json
+import logging
+import pathlib
+import threading
+
+import torch
+
+
+def compute_weights_fingerprint(weights_path):
+    """Compute a fingerprint of the contents of a local weights folder
+
+    The fingerprint is based on the path, size and modification time of
+    each file, so it's cheap to compute and changes whenever a file is
+    added, removed or modified
+
+    :param weights_path: Path to the local weights folder
+    :type weights_path: str | os.PathLike
+
+    :return: Fingerprint
+    :rtype: str
+    """
+    weights_path = pathlib.Path(weights_path)
+
+    manifest = []
+    for path in sorted(weights_path.rglob("*")):
+        if not path.is_file():
+            continue
+        stat = path.stat()
+        manifest.append(
+            [
+                path.relative_to(weights_path).as_posix(),
+                stat.st_size,
+                stat.st_mtime_ns,
+            ]
+        )
+
+    digest = hashlib.sha256(json.dumps(manifest).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def make_pipeline_key(
+    pipeline_class,
+    weights_path,
+    *,
+    torch_dtype,
+    device,
+    enable_attention_slicing,
+):
+    """Make the key that identifies a loaded pipeline in the registry
+
+    :param pipeline_class: Diffusers pipeline class
+    :type pipeline_class: type[diffusers.DiffusionPipeline]
+    :param weights_path: Path to the local weights folder
+    :type weights_path: str | os.PathLike
+    :param torch_dtype: dtype that the pipeline is loaded under
+    :type torch_dtype: torch.dtype | None
+    :param device: Device that the pipeline is loaded on
+    :type device: torch.device
+    :param enable_attention_slicing: Whether sliced attention is
+        enabled
+    :type enable_attention_slicing: bool
+
+    :return: Key of the pipeline
+    :rtype: tuple[str, ...]
+    """
+    weights_path = pathlib.Path(weights_path).resolve()
+    return (
+        f"{pipeline_class.__module__}.{pipeline_class.__qualname__}",
+        str(weights_path),
+        compute_weights_fingerprint(weights_path),
+        str(torch_dtype),
+        str(device),
+        str(bool(enable_attention_slicing)),
+    )
+
+
+class PipelineRegistry:
+    """In-process registry of loaded pipelines
+
+    The registry keeps up to `max_size` pipelines loaded, so that
+    generators that are created with the same weights and settings in
+    the same process reuse them instead of loading the weights again.
+    Pipelines are evicted in least-recently-used order
+    """
+
+    __slots__ = ("_max_size", "_pipelines", "_lock")
+
+    def __init__(self, max_size=2):
+        """
+        :param max_size: Maximum number of pipelines to keep loaded
+        :type max_size: int
+
+        :return: None
+        """
+        self._max_size = max_size
+        self._pipelines = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def max_size(self):
+        """Maximum number of pipelines to keep loaded
+
+        :rtype: int
+        """
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, max_size):
+        with self._lock:
+            self._max_size = max_size
+            self._evict()
+
+    def __len__(self):
+        return len(self._pipelines)
+
+    def __contains__(self, key):
+        return key in self._pipelines
+
+    def get(self, key):
+        """Get a loaded pipeline
+
+        :param key: Key of the pipeline, made by `make_pipeline_key()`
+        :type key: tuple[str, ...]
+
+        :return: Pipeline, or `None` if it isn't loaded
+        :rtype: diffusers.DiffusionPipeline | None
+        """
+        with self._lock:
+            pipe = self._pipelines.get(key)
+            if pipe is not None:
+                self._pipelines.move_to_end(key)
+            return pipe
+
+    def add(self, key, pipe):
+        """Add a loaded pipeline to the registry
+
+        The least recently used pipelines are evicted if the registry
+        is full
+
+        :param key: Key of the pipeline, made by `make_pipeline_key()`
+        :type key: tuple[str, ...]
+        :param pipe: Loaded pipeline
+        :type pipe: diffusers.DiffusionPipeline
+
+        :return: None
+        """
+        with self._lock:
+            self._pipelines[key] = pipe
+            self._pipelines.move_to_end(key)
+            self._evict()
+
+    def release(self, key=None):
+        """Remove pipelines from the registry so that their memory can
+        be freed
+
+        The memory is only freed once the generators that use the
+        pipelines are deleted too
+
+        :param key: Key of the pipeline to remove. If `None`, all the
+            pipelines are removed
+        :type key: tuple[str, ...] | None
+
+        :return: None
+        """
+        with self._lock:
+            if key is None:
+                released = bool(self._pipelines)
+                self._pipelines.clear()
+            else:
+                released = self._pipelines.pop(key, None) is not None
+
+        if released:
+            _free_memory()
+
+    def _evict(self):
+        """Evict pipelines until the registry fits in `max_size`"""
+        evicted = False
+        while len(self._pipelines) > max(self._max_size, 0):
+            key, _ = self._pipelines.popitem(last=False)
+            logging.info("Evicted loaded pipeline: %s", key[0])
+            evicted = True
+
+        if evicted:
+            _free_memory()
+
+
+def _free_memory():
+    """Free the memory of the pipelines that aren't referenced anymore"""
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+_default_registry = PipelineRegistry()
+
+
+def get_pipeline_registry():
+    """Get the registry that the image generators use by default
+
+    :return: Default pipeline registry
+    :rtype: PipelineRegistry
+    """
+    return _default_registry
@@ -0,0 +1,253 @@
+import inspect
+import json
+import logging
+import posixpath
+import re
+
+import torch
+from diffusers.utils import is_safetensors_available
+
+from ai_art.folder import list_remote_files
+
+MODEL_INDEX_PATH = "/model_index.json"
+
+# Weights files that Diffusers and Transformers load, e.g.
+# "diffusion_pytorch_model.bin", "model.fp16.safetensors" or
+# "pytorch_model-00001-of-00002.bin"
+_WEIGHTS_NAME_PATTERN = re.compile(
+    r"^(?P<name>diffusion_pytorch_model|pytorch_model|model)"
+    r"(?P<shard>-\d+-of-\d+)?"
+    r"(?:\.(?P<variant>[\w-]+))?"
+    r"\.(?P<format>bin|safetensors)"
+    r"(?P<index>\.index\.json)?$"
+)
+# Extensions of weights files that the pipeline never loads, e.g. full
+# checkpoints or weights for other frameworks
+_OTHER_WEIGHTS_EXTENSIONS = (
+    ".bin",
+    ".safetensors",
+    ".ckpt",
+    ".pt",
+    ".pth",
+    ".msgpack",
+    ".h5",
+    ".onnx",
+    ".pb",
+)
+
+
+def match_weights_filename(filename):
+    """Match the filename of weights that Diffusers or Transformers load
+
+    :param filename: Filename, e.g. "diffusion_pytorch_model.fp16.bin"
+    :type filename: str
+
+    :return: Match with the "name", "shard", "variant", "format" and
+        "index" groups, or `None` if the file isn't loaded by the
+        pipeline
+    :rtype: re.Match | None
+    """
+    return _WEIGHTS_NAME_PATTERN.match(filename)
+
+
+def get_pipeline_components(pipeline_class, model_index):
+    """Get the components that a pipeline loads from the weights
+
+    :param pipeline_class: Diffusers pipeline class
+    :type pipeline_class: type[diffusers.DiffusionPipeline]
+    :param model_index: Contents of the "model_index.json" file
+    :type model_index: Mapping[str, Any]
+
+    :return: Components that will be loaded, mapped to their
+        (library name, class name)
+    :rtype: dict[str, tuple[str, str]]
+    """
+    parameters = inspect.signature(pipeline_class.__init__).parameters
+
+    components = {}
+    for name, value in model_index.items():
+        if name.startswith("_") or name not in parameters:
+            continue
+        # Components that are set to `null` aren't loaded
+        if not isinstance(value, list) or value[0] is None:
+            continue
+        components[name] = tuple(value)
+
+    return components
+
+
+def _choose_variant(variants, torch_dtype):
+    """Choose which variant of a component's weights to load
+
+    :param variants: Available variants, `None` being the default
+        variant
+    :type variants: set[str | None]
+    :param torch_dtype: dtype that the pipeline will be loaded under
+    :type torch_dtype: torch.dtype | None
+
+    :return: Chosen variant
+    :rtype: str | None
+    """
+    preferred_variants = [None, "fp16"]
+    if torch_dtype is torch.float16:
+        # Half-precision weights are half the size, and the pipeline
+        # would cast the full-precision weights to float16 anyway
+        preferred_variants.reverse()
+
+    for variant in preferred_variants:
+        if variant in variants:
+            return variant
+
+    return min(variants)
+
+
+def _select_component_files(component_files, torch_dtype):
+    """Select the files of a component that will be downloaded
+
+    :param component_files: Files in the component's subfolder
+    :type component_files: Iterable[ai_art.folder.RemoteFile]
+    :param torch_dtype: dtype that the pipeline will be loaded under
+    :type torch_dtype: torch.dtype | None
+
+    :return: Selected files
+    :rtype: list[ai_art.folder.RemoteFile]
+    """
+    selected_files = []
+    weights_files = []
+    for remote_file in component_files:
+        filename = posixpath.basename(remote_file.path)
+        match = match_weights_filename(filename)
+        if match:
+            weights_files.append((remote_file, match))
+        elif not filename.endswith(_OTHER_WEIGHTS_EXTENSIONS):
+            # Configs, tokenizer vocabularies, etc.
+            selected_files.append(remote_file)
+
+    if not weights_files:
+        return selected_files
+
+    variant = _choose_variant(
+        {match["variant"] for _, match in weights_files}, torch_dtype
+    )
+    weights_files = [
+        (remote_file, match)
+        for remote_file, match in weights_files
+        if match["variant"] == variant
+    ]
+
+    # Safetensors files are preferred by the pipeline if the library is
+    # installed, so the pickled files won't be loaded
+    formats = {match["format"] for _, match in weights_files}
+    if "safetensors" in formats and is_safetensors_available():
+        weights_format = "safetensors"
+    else:
+        weights_format = "bin"
+
+    for remote_file, match in weights_files:
+        if match["format"] != weights_format:
+            continue
+
+        if variant is not None and not match["shard"]:
+            # The version of Diffusers in the code env doesn't support
+            # variants, so the file is saved under the default name
+            local_filename = (
+                f"{match['name']}.{match['format']}{match['index'] or ''}"
+            )
+            local_path = posixpath.join(
+                posixpath.dirname(remote_file.path), local_filename
+            )
+            remote_file = remote_file._replace(local_path=local_path)
+
+        selected_files.append(remote_file)
+
+    return selected_files
+
+
+def select_pipeline_files(
+    remote_files, model_index, pipeline_class, *, torch_dtype=None
+):
+    """Select the files of a weights folder that a pipeline will load
+
+    Files outside of the pipeline's component subfolders are skipped,
+    e.g. full ".ckpt" checkpoints or Git metadata. Within each
+    component subfolder, only the weights of one variant and one format
+    are selected
+
+    :param remote_files: Files of the weights folder
+    :type remote_files: Iterable[ai_art.folder.RemoteFile]
+    :param model_index: Contents of the "model_index.json" file
+    :type model_index: Mapping[str, Any]
+    :param pipeline_class: Diffusers pipeline class
+    :type pipeline_class: type[diffusers.DiffusionPipeline]
+    :param torch_dtype: dtype that the pipeline will be loaded under
+    :type torch_dtype: torch.dtype | None
+
+    :return: Selected files
+    :rtype: list[ai_art.folder.RemoteFile]
+    """
+    components = get_pipeline_components(pipeline_class, model_index)
+
+    files_by_component = {name: [] for name in components}
+    selected_files = []
+    for remote_file in remote_files:
+        rel_path = remote_file.path.lstrip("/")
+        if remote_file.path == MODEL_INDEX_PATH:
+            selected_files.append(remote_file)
+        elif "/" in rel_path:
+            component_name = rel_path.split("/", 1)[0]
+            if component_name in files_by_component:
+                files_by_component[component_name].append(remote_file)
+
+    for component_files in files_by_component.values():
+        selected_files.extend(
+            _select_component_files(component_files, torch_dtype)
+        )
+
+    selected_files.sort(key=lambda remote_file: remote_file.path)
+    return selected_files
+
+
+def list_pipeline_files(remote_folder, pipeline_class, torch_dtype=None):
+    """List the files of a remote weights folder that a pipeline will
+    load
+
+    :param remote_folder: Remote weights folder
+    :type remote_folder: Dataiku.folder
+    :param pipeline_class: Diffusers pipeline class
+    :type pipeline_class: type[diffusers.DiffusionPipeline]
+    :param torch_dtype: dtype that the pipeline will be loaded under
+    :type torch_dtype: torch.dtype | None
+
+    :return: Files that need to be downloaded
+    :rtype: list[ai_art.folder.RemoteFile]
+    """
+    remote_files = list_remote_files(remote_folder)
+
+    remote_paths = {remote_file.path for remote_file in remote_files}
+    if MODEL_INDEX_PATH not in remote_paths:
+        logging.warning(
+            "The weights folder doesn't contain %r. All files will be "
+            "downloaded",
+            MODEL_INDEX_PATH,
+        )
+        return remote_files
+
+    with remote_folder.get_download_stream(MODEL_INDEX_PATH) as file:
+        model_index = json.load(file)
+
+    selected_files = select_pipeline_files(
+        remote_files, model_index, pipeline_class, torch_dtype=torch_dtype
+    )
+
+    total_size = sum(remote_file.size for remote_file in remote_files)
+    selected_size = sum(remote_file.size for remote_file in selected_files)
+    logging.info(
+        "Selected %s of %s files from the weights folder. %.1f MB of "
+        "%.1f MB will be skipped",
+        len(selected_files),
+        len(remote_files),
+        (total_size - selected_size) / 1024**2,
+        total_size / 1024**2,
+    )
+
+    return selected_files
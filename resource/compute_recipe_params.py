@@ -9,7 +9,12 @@ def compute_device(payload, config, plugin_config, inputs):
         {"value": "cpu", "label": "CPU (disable CUDA)"},
     ]
 
-    for i in range(torch.cuda.device_count()):
+    device_count = torch.cuda.device_count()
+    if device_count > 1:
+        label = f"All CUDA devices ({device_count})"
+        choices.append({"value": "all", "label": label})
+
+    for i in range(device_count):
         device_name = torch.cuda.get_device_name(i)
         value = f"cuda:{i}"
         label = f"{value} ({device_name})"
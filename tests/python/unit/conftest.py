@@ -0,0 +1,173 @@
+import contextlib
+import io
+import json
+import string
+import time
+
+import pytest
+import torch
+from diffusers import (
+    AutoencoderKL,
+    PNDMScheduler,
+    StableDiffusionPipeline,
+    UNet2DConditionModel,
+)
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+
+from ai_art.registry import get_pipeline_registry
+
+
+@pytest.fixture(autouse=True)
+def release_pipelines():
+    """Don't reuse the pipelines that were loaded by other tests"""
+    yield
+    get_pipeline_registry().release()
+
+
+class FakeFolder:
+    """In-memory stand-in for a remote `dataiku.Folder`"""
+
+    def __init__(self, files, folder_id="WEIGHTS", name="weights"):
+        """
+        :param files: Contents of the folder, keyed by path
+        :type files: dict[str, bytes]
+        """
+        self.files = dict(files)
+        self.folder_id = folder_id
+        self.name = name
+        self.download_count = 0
+        self.downloaded_paths = []
+        # Seconds to wait before each download starts, to simulate a
+        # remote folder
+        self.latency = 0.0
+        # Paths that will fail to download
+        self.failing_paths = set()
+
+    def get_id(self):
+        return self.folder_id
+
+    def get_path(self):
+        raise Exception("The folder isn't on the local filesystem")
+
+    def list_paths_in_partition(self):
+        return list(self.files)
+
+    def get_path_details(self, path):
+        return {"size": len(self.files[path]), "lastModified": 1}
+
+    @contextlib.contextmanager
+    def get_download_stream(self, path):
+        time.sleep(self.latency)
+        if path in self.failing_paths:
+            raise IOError(f"Failed to download {path}")
+
+        self.download_count += 1
+        self.downloaded_paths.append(path)
+        yield io.BytesIO(self.files[path])
+
+    @contextlib.contextmanager
+    def get_writer(self, path):
+        buffer = io.BytesIO()
+        yield buffer
+        self.files[path] = buffer.getvalue()
+
+    def clear(self):
+        self.files.clear()
+
+
+@pytest.fixture
+def weights_folder():
+    """Create a fake remote weights folder"""
+    return FakeFolder(
+        {
+            "/model_index.json": b"{}",
+            "/unet/config.json": b"{}",
+            "/unet/diffusion_pytorch_model.bin": b"u" * 1000,
+            "/vae/diffusion_pytorch_model.bin": b"v" * 500,
+        }
+    )
+
+
+def _create_tiny_tokenizer(vocab_dir):
+    """Create a CLIP tokenizer with a tiny vocabulary of single letters"""
+    tokens = ["<|startoftext|>", "<|endoftext|>"]
+    tokens.extend(string.ascii_lowercase)
+    tokens.extend(f"{letter}</w>" for letter in string.ascii_lowercase)
+
+    vocab_dir.mkdir(parents=True, exist_ok=True)
+    vocab_path = vocab_dir / "vocab.json"
+    vocab_path.write_text(json.dumps({t: i for i, t in enumerate(tokens)}))
+    merges_path = vocab_dir / "merges.txt"
+    merges_path.write_text("#version: 0.2\n")
+
+    return CLIPTokenizer(
+        str(vocab_path), str(merges_path), model_max_length=77
+    )
+
+
+@pytest.fixture(scope="session")
+def tiny_weights_path(tmp_path_factory):
+    """Save a tiny, randomly initialized Stable Diffusion pipeline
+
+    The pipeline has the same layout as the real weights, so it can be
+    loaded on the CPU in a fraction of a second
+    """
+    path = tmp_path_factory.mktemp("tiny-weights")
+
+    torch.manual_seed(0)
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64),
+        layers_per_block=1,
+        sample_size=8,
+        in_channels=4,
+        out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        cross_attention_dim=32,
+        attention_head_dim=4,
+    )
+    vae = AutoencoderKL(
+        block_out_channels=(32, 64),
+        in_channels=3,
+        out_channels=3,
+        down_block_types=("DownEncoderBlock2D", "DownEncoderBlock2D"),
+        up_block_types=("UpDecoderBlock2D", "UpDecoderBlock2D"),
+        latent_channels=4,
+    )
+    text_encoder = CLIPTextModel(
+        CLIPTextConfig(
+            bos_token_id=0,
+            eos_token_id=1,
+            pad_token_id=1,
+            hidden_size=32,
+            intermediate_size=37,
+            num_attention_heads=4,
+            num_hidden_layers=2,
+            vocab_size=1000,
+        )
+    )
+    pipe = StableDiffusionPipeline(
+        vae=vae,
+        text_encoder=text_encoder,
+        tokenizer=_create_tiny_tokenizer(path / "vocab"),
+        unet=unet,
+        scheduler=PNDMScheduler(skip_prk_steps=True, steps_offset=1),
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False,
+    )
+
+    weights_path = path / "weights"
+    pipe.save_pretrained(weights_path)
+    return weights_path
+
+
+@pytest.fixture
+def tiny_weights_folder(tiny_weights_path):
+    """Create a fake remote folder that contains the tiny weights"""
+    files = {
+        f"/{path.relative_to(tiny_weights_path).as_posix()}": path.read_bytes()
+        for path in tiny_weights_path.rglob("*")
+        if path.is_file()
+    }
+    return FakeFolder(files, folder_id="TINY_WEIGHTS")
@@ -0,0 +1,74 @@
+from ai_art.cache import WeightsCache
+from ai_art.folder import download_folder, list_remote_files
+
+
+def _populate(cache, folder):
+    """Acquire the cache entry of the folder, downloading it if needed"""
+    entry = cache.acquire(folder, list_remote_files(folder))
+    if not entry.is_complete:
+        download_folder(folder, entry.path)
+        entry.commit()
+    return entry
+
+
+class TestWeightsCache:
+    def test_new_entry_incomplete(self, tmp_path, weights_folder):
+        cache = WeightsCache(tmp_path)
+        entry = cache.acquire(
+            weights_folder, list_remote_files(weights_folder)
+        )
+
+        assert not entry.is_complete
+        entry.cleanup()
+
+    def test_reuse_entry(self, tmp_path, weights_folder):
+        cache = WeightsCache(tmp_path)
+        _populate(cache, weights_folder).cleanup()
+        download_count = weights_folder.download_count
+
+        entry = cache.acquire(
+            weights_folder, list_remote_files(weights_folder)
+        )
+        assert entry.is_complete
+        assert (entry.path / "unet" / "diffusion_pytorch_model.bin").exists()
+        entry.cleanup()
+
+        # Nothing was downloaded the second time
+        assert weights_folder.download_count == download_count
+
+    def test_modified_folder_new_entry(self, tmp_path, weights_folder):
+        cache = WeightsCache(tmp_path)
+        first_entry = _populate(cache, weights_folder)
+        first_entry.cleanup()
+
+        weights_folder.files["/vae/config.json"] = b"{}"
+        second_entry = cache.acquire(
+            weights_folder, list_remote_files(weights_folder)
+        )
+
+        assert not second_entry.is_complete
+        assert second_entry.path != first_entry.path
+        second_entry.cleanup()
+
+    def test_evict_least_recently_used(self, tmp_path, weights_folder):
+        cache = WeightsCache(tmp_path, max_size=2000)
+        first_entry = _populate(cache, weights_folder)
+        first_entry.cleanup()
+
+        weights_folder.files["/vae/config.json"] = b"{}"
+        second_entry = _populate(cache, weights_folder)
+        second_entry.cleanup()
+
+        assert not first_entry.path.exists()
+        assert second_entry.path.exists()
+
+    def test_entry_in_use_not_evicted(self, tmp_path, weights_folder):
+        cache = WeightsCache(tmp_path, max_size=2000)
+        first_entry = _populate(cache, weights_folder)
+
+        weights_folder.files["/vae/config.json"] = b"{}"
+        second_entry = _populate(cache, weights_folder)
+
+        assert first_entry.path.exists()
+        first_entry.cleanup()
+        second_entry.cleanup()
@@ -0,0 +1,87 @@
+import gc
+import shutil
+
+from PIL import Image
+
+from ai_art.components import ComponentStore, get_component_store
+from ai_art.generate_image import TextGuidedImageToImage, TextToImage
+
+
+class TestComponentStore:
+    def test_identical_files(self, tmp_path, tiny_weights_path):
+        store = ComponentStore()
+        first_path = tmp_path / "first"
+        second_path = tmp_path / "second"
+        shutil.copytree(tiny_weights_path / "vae", first_path)
+        shutil.copytree(tiny_weights_path / "vae", second_path)
+
+        first_key = store.make_key(first_path, object, None, "cpu")
+        assert store.make_key(second_path, object, None, "cpu") == first_key
+
+        (second_path / "config.json").write_text("{}")
+        assert store.make_key(second_path, object, None, "cpu") != first_key
+
+    def test_weak_references(self):
+        store = ComponentStore()
+        component = object.__new__(type("Component", (), {}))
+        store.add(("a",), component)
+        assert store.get(("a",)) is component
+
+        del component
+        gc.collect()
+        assert store.get(("a",)) is None
+
+
+class TestSharedComponents:
+    def test_identical_weights_folders(self, tmp_path, tiny_weights_path):
+        first_path = tmp_path / "first"
+        second_path = tmp_path / "second"
+        shutil.copytree(tiny_weights_path, first_path)
+        shutil.copytree(tiny_weights_path, second_path)
+        # Only the UNet differs
+        config_path = second_path / "unet" / "config.json"
+        config_path.write_text(config_path.read_text() + "\n")
+
+        first = TextToImage(first_path, device_id="cpu")
+        second = TextToImage(second_path, device_id="cpu")
+
+        assert first._pipe is not second._pipe
+        assert first._pipe.vae is second._pipe.vae
+        assert first._pipe.text_encoder is second._pipe.text_encoder
+        assert first._pipe.unet is not second._pipe.unet
+
+    def test_no_sharing(self, tiny_weights_path):
+        first = TextToImage(
+            tiny_weights_path, device_id="cpu", reuse_pipeline=False
+        )
+        second = TextToImage(
+            tiny_weights_path, device_id="cpu", reuse_pipeline=False
+        )
+        assert first._pipe.vae is not second._pipe.vae
+
+    def test_release(self, tiny_weights_path):
+        generator = TextToImage(tiny_weights_path, device_id="cpu")
+        assert len(get_component_store()) > 0
+
+        generator.release()
+        gc.collect()
+        assert len(get_component_store()) == 0
+
+
+class TestFromGenerator:
+    def test_generate_images(self, tiny_weights_path):
+        text_to_image = TextToImage(tiny_weights_path, device_id="cpu")
+        image_to_image = TextGuidedImageToImage.from_generator(text_to_image)
+
+        assert image_to_image._pipe.unet is text_to_image._pipe.unet
+        assert image_to_image._pipe.scheduler is not (
+            text_to_image._pipe.scheduler
+        )
+
+        init_image = Image.new("RGB", (64, 64))
+        images = list(
+            image_to_image.generate_images(
+                "a cat", init_image, num_inference_steps=2
+            )
+        )
+        assert images[0].size == (64, 64)
@@ -0,0 +1,58 @@
+import json
+
+import torch
+from diffusers import StableDiffusionPipeline
+from safetensors.torch import load_file
+
+from ai_art.convert import MANIFEST_FILENAME, convert_weights
+
+
+class TestConvertWeights:
+    def test_convert_to_safetensors(self, tmp_path, tiny_weights_path):
+        output_path = tmp_path / "optimized"
+        convert_weights(tiny_weights_path, output_path)
+
+        assert not list(output_path.rglob("*.bin"))
+        assert (
+            output_path / "unet" / "diffusion_pytorch_model.safetensors"
+        ).exists()
+        assert (output_path / "text_encoder" / "model.safetensors").exists()
+        assert (output_path / "tokenizer" / "vocab.json").exists()
+
+    def test_half_precision(self, tmp_path, tiny_weights_path):
+        output_path = tmp_path / "optimized"
+        convert_weights(
+            tiny_weights_path, output_path, torch_dtype=torch.float16
+        )
+
+        state_dict = load_file(
+            str(output_path / "vae" / "diffusion_pytorch_model.safetensors")
+        )
+        assert all(
+            tensor.dtype is torch.float16 for tensor in state_dict.values()
+        )
+
+    def test_manifest(self, tmp_path, tiny_weights_path):
+        output_path = tmp_path / "optimized"
+        manifest = convert_weights(tiny_weights_path, output_path)
+
+        with open(output_path / MANIFEST_FILENAME) as file:
+            assert json.load(file) == manifest
+
+        manifest_paths = {file["path"] for file in manifest["files"]}
+        assert "/unet/diffusion_pytorch_model.safetensors" in manifest_paths
+
+    def test_load_converted_weights(self, tmp_path, tiny_weights_path):
+        output_path = tmp_path / "optimized"
+        convert_weights(tiny_weights_path, output_path)
+
+        original_pipe = StableDiffusionPipeline.from_pretrained(
+            tiny_weights_path
+        )
+        converted_pipe = StableDiffusionPipeline.from_pretrained(output_path)
+
+        for name in ("unet", "vae", "text_encoder"):
+            original_state_dict = getattr(original_pipe, name).state_dict()
+            converted_state_dict = getattr(converted_pipe, name).state_dict()
+            for key, tensor in original_state_dict.items():
+                assert torch.equal(tensor, converted_state_dict[key])
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from ai_art.folder import FolderDownload, download_folder
+
+
+class TestDownloadFolder:
+    def test_download_all_files(self, tmp_path, weights_folder):
+        downloaded_size = download_folder(weights_folder, tmp_path)
+
+        for remote_path, content in weights_folder.files.items():
+            local_path = tmp_path / remote_path.lstrip("/")
+            assert local_path.read_bytes() == content
+        assert downloaded_size == sum(
+            len(content) for content in weights_folder.files.values()
+        )
+        assert not list(tmp_path.rglob("*.part"))
+
+    def test_largest_first(self, tmp_path, weights_folder):
+        download_folder(weights_folder, tmp_path, max_workers=1)
+        assert weights_folder.downloaded_paths[:2] == [
+            "/unet/diffusion_pytorch_model.bin",
+            "/vae/diffusion_pytorch_model.bin",
+        ]
+
+    def test_parallel(self, tmp_path, weights_folder):
+        weights_folder.latency = 0.2
+
+        start_time = time.perf_counter()
+        download_folder(weights_folder, tmp_path, max_workers=4)
+        elapsed_time = time.perf_counter() - start_time
+
+        # 4 files downloaded one after another would take at least 0.8 s
+        assert elapsed_time < 0.6
+
+    def test_resume(self, tmp_path, weights_folder):
+        failing_path = "/vae/diffusion_pytorch_model.bin"
+        weights_folder.failing_paths.add(failing_path)
+        with pytest.raises(IOError):
+            download_folder(weights_folder, tmp_path, max_workers=1)
+
+        weights_folder.failing_paths.clear()
+        weights_folder.downloaded_paths.clear()
+        download_folder(weights_folder, tmp_path, max_workers=1)
+
+        # Only the file that failed (and the ones that were cancelled
+        # after it) are downloaded again
+        assert failing_path in weights_folder.downloaded_paths
+        assert (
+            "/unet/diffusion_pytorch_model.bin"
+            not in weights_folder.downloaded_paths
+        )
+
+
+class TestFolderDownload:
+    def test_wait_for_dir(self, tmp_path, weights_folder):
+        weights_download = FolderDownload(weights_folder, tmp_path)
+        weights_download.start()
+
+        weights_download.wait_for("unet")
+        assert (tmp_path / "unet" / "diffusion_pytorch_model.bin").exists()
+        assert (tmp_path / "unet" / "config.json").exists()
+
+        weights_download.wait()
+
+    def test_error_raised(self, tmp_path, weights_folder):
+        weights_folder.failing_paths.add("/unet/config.json")
+        weights_download = FolderDownload(weights_folder, tmp_path)
+        weights_download.start()
+
+        with pytest.raises(IOError):
+            weights_download.wait_for("unet")
+        with pytest.raises(IOError):
+            weights_download.wait()
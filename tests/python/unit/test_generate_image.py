@@ -191,3 +191,81 @@ class TestTextGuidedImageToImage:
             num_inference_steps=30,
             guidance_scale=6.0,
         )
+
+
+class TestDataParallel:
+    @pytest.fixture(autouse=True)
+    def setup_generator(self, mocker):
+        """Create a generator with two mocked "cpu" replicas"""
+        self.from_pretrained = mocker.patch(
+            "diffusers.StableDiffusionPipeline.from_pretrained"
+        )
+        self.pipes = [
+            self.from_pretrained.return_value.to.return_value,
+            unittest.mock.MagicMock(),
+            unittest.mock.MagicMock(),
+        ]
+        for pipe_index, pipe in enumerate(self.pipes):
+            pipe.side_effect = self._make_pipe_call(pipe_index)
+        mocker.patch(
+            "ai_art.generate_image._copy_pipeline",
+            side_effect=self.pipes[1:],
+        )
+
+        self.generator = TextToImage(
+            "/path/to/weights", device_id=["cpu", "cpu", "cpu"]
+        )
+
+    @staticmethod
+    def _make_pipe_call(pipe_index):
+        """Make a fake pipeline call that returns the seed of the batch
+
+        :param pipe_index: Index of the pipe
+        :type pipe_index: int
+        """
+
+        def call(num_images_per_prompt, generator, **kwargs):
+            seed = None if generator is None else generator.initial_seed()
+            images = [(seed, i) for i in range(num_images_per_prompt)]
+            return unittest.mock.Mock(images=images)
+
+        return call
+
+    def test_all_devices_used(self):
+        images = list(
+            self.generator.generate_images(
+                "PROMPT", image_count=30, batch_size=1, random_seed=1
+            )
+        )
+
+        assert len(images) == 30
+        assert sum(pipe.call_count for pipe in self.pipes) == 30
+
+    def test_image_order(self):
+        images = list(
+            self.generator.generate_images(
+                "PROMPT", image_count=7, batch_size=2, random_seed=1
+            )
+        )
+
+        assert [i for _, i in images] == [0, 1, 0, 1, 0, 1, 0]
+        # Each batch has its own seed
+        batch_seeds = [seed for seed, i in images if i == 0]
+        assert len(set(batch_seeds)) == 4
+
+    def test_deterministic_seeds(self):
+        kwargs = {"image_count": 8, "batch_size": 2, "random_seed": 42}
+        first = list(self.generator.generate_images("PROMPT", **kwargs))
+        second = list(self.generator.generate_images("PROMPT", **kwargs))
+
+        assert first == second
+
+    def test_error(self):
+        self.pipes[1].side_effect = RuntimeError("OOM")
+
+        with pytest.raises(RuntimeError):
+            _exhaust(
+                self.generator.generate_images(
+                    "PROMPT", image_count=30, batch_size=1
+                )
+            )
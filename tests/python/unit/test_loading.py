@@ -0,0 +1,123 @@
+import torch
+from diffusers import StableDiffusionPipeline, UNet2DConditionModel
+
+from ai_art.folder import FolderDownload
+from ai_art.generate_image import TextToImage
+from ai_art.loading import load_pipeline_components
+
+COMPONENT_NAMES = {"scheduler", "text_encoder", "tokenizer", "unet", "vae"}
+
+
+class TestLoadPipelineComponents:
+    def test_local_weights(self, tiny_weights_path):
+        components = load_pipeline_components(
+            StableDiffusionPipeline, tiny_weights_path
+        )
+        assert set(components) == COMPONENT_NAMES
+
+    def test_while_downloading(self, tmp_path, tiny_weights_folder):
+        tiny_weights_folder.latency = 0.05
+        weights_download = FolderDownload(
+            tiny_weights_folder, tmp_path, max_workers=2
+        )
+        weights_download.start()
+
+        components = load_pipeline_components(
+            StableDiffusionPipeline,
+            tmp_path,
+            weights_download=weights_download,
+        )
+        weights_download.wait()
+
+        assert set(components) == COMPONENT_NAMES
+
+        # The components can be assembled without loading them again
+        pipe = StableDiffusionPipeline.from_pretrained(tmp_path, **components)
+        assert pipe.unet is components["unet"]
+
+
+class TestParallelLoading:
+    def test_generate_images(self, tiny_weights_path):
+        generator = TextToImage(
+            tiny_weights_path, device_id="cpu", parallel_loading=True
+        )
+        images = list(
+            generator.generate_images(
+                "a cat", height=64, width=64, num_inference_steps=2
+            )
+        )
+        assert images[0].size == (64, 64)
+
+
+class TestLowMemoryLoading:
+    def test_same_weights(self, tiny_weights_path):
+        components = load_pipeline_components(
+            StableDiffusionPipeline,
+            tiny_weights_path,
+            device=torch.device("cpu"),
+            low_cpu_mem_usage=True,
+        )
+        reference = StableDiffusionPipeline.from_pretrained(tiny_weights_path)
+
+        for name in ("unet", "vae", "text_encoder"):
+            state_dict = components[name].state_dict()
+            for key, tensor in reference.components[name].state_dict().items():
+                assert not state_dict[key].is_meta
+                assert torch.equal(state_dict[key], tensor), (name, key)
+
+    def test_torch_dtype(self, tiny_weights_path):
+        components = load_pipeline_components(
+            StableDiffusionPipeline,
+            tiny_weights_path,
+            torch_dtype=torch.float16,
+            device=torch.device("cpu"),
+            low_cpu_mem_usage=True,
+        )
+        assert components["unet"].dtype is torch.float16
+
+    def test_fallback(self, mocker, tiny_weights_path):
+        mocker.patch("ai_art.loading._find_weights_file", return_value=None)
+        spy = mocker.spy(UNet2DConditionModel, "from_pretrained")
+
+        components = load_pipeline_components(
+            StableDiffusionPipeline,
+            tiny_weights_path,
+            device=torch.device("cpu"),
+            low_cpu_mem_usage=True,
+        )
+
+        spy.assert_called_once()
+        assert isinstance(components["unet"], UNet2DConditionModel)
+
+    def test_generate_images(self, tiny_weights_path):
+        generator = TextToImage(
+            tiny_weights_path, device_id="cpu", low_cpu_mem_usage=True
+        )
+        images = list(
+            generator.generate_images(
+                "a cat", height=64, width=64, num_inference_steps=2
+            )
+        )
+        assert images[0].size == (64, 64)
+
+
+class TestDataParallel:
+    def test_same_images_as_single_device(self, tiny_weights_path):
+        kwargs = {
+            "image_count": 4,
+            "batch_size": 1,
+            "random_seed": 7,
+            "height": 64,
+            "width": 64,
+            "num_inference_steps": 2,
+        }
+        generator = TextToImage(tiny_weights_path, device_id=["cpu", "cpu"])
+        assert generator._replicas[0][1].unet is not generator._pipe.unet
+
+        images = list(generator.generate_images("a cat", **kwargs))
+        assert len(images) == 4
+
+        # The images don't depend on the device that generated them
+        images_again = list(generator.generate_images("a cat", **kwargs))
+        for image, image_again in zip(images, images_again):
+            assert image.tobytes() == image_again.tobytes()
@@ -0,0 +1,26 @@
+from ai_art.memory import PeakRssSampler, format_bytes, get_rss
+
+
+class TestPeakRssSampler:
+    def test_peak_rss(self):
+        with PeakRssSampler() as sampler:
+            data = bytearray(64 * 1024**2)
+
+        assert sampler.peak_rss >= len(data)
+
+    def test_without_proc(self, mocker):
+        mocker.patch("ai_art.memory.get_rss", return_value=None)
+
+        with PeakRssSampler() as sampler:
+            pass
+
+        assert sampler.peak_rss > 0
+
+
+def test_get_rss():
+    assert get_rss() > 0
+
+
+def test_format_bytes():
+    assert format_bytes(1536 * 1024**2) == "1536.0 MB"
+    assert format_bytes(None) == "unknown"
@@ -0,0 +1,94 @@
+import pytest
+
+from ai_art.generate_image import TextToImage
+from ai_art.registry import (
+    PipelineRegistry,
+    compute_weights_fingerprint,
+    get_pipeline_registry,
+)
+
+
+class TestPipelineRegistry:
+    def test_get(self):
+        registry = PipelineRegistry()
+        registry.add(("a",), "PIPE_A")
+
+        assert registry.get(("a",)) == "PIPE_A"
+        assert registry.get(("b",)) is None
+
+    def test_lru_eviction(self):
+        registry = PipelineRegistry(max_size=2)
+        registry.add(("a",), "PIPE_A")
+        registry.add(("b",), "PIPE_B")
+        registry.get(("a",))
+        registry.add(("c",), "PIPE_C")
+
+        assert ("a",) in registry
+        assert ("b",) not in registry
+        assert ("c",) in registry
+
+    def test_max_size_setter(self):
+        registry = PipelineRegistry(max_size=2)
+        registry.add(("a",), "PIPE_A")
+        registry.add(("b",), "PIPE_B")
+        registry.max_size = 1
+
+        assert len(registry) == 1
+        assert ("b",) in registry
+
+    def test_release(self):
+        registry = PipelineRegistry()
+        registry.add(("a",), "PIPE_A")
+        registry.add(("b",), "PIPE_B")
+
+        registry.release(("a",))
+        assert len(registry) == 1
+
+        registry.release()
+        assert len(registry) == 0
+
+
+def test_fingerprint_changes(tmp_path):
+    (tmp_path / "unet").mkdir()
+    (tmp_path / "unet" / "config.json").write_text("{}")
+    fingerprint = compute_weights_fingerprint(tmp_path)
+
+    assert compute_weights_fingerprint(tmp_path) == fingerprint
+
+    (tmp_path / "unet" / "config.json").write_text('{"a": 1}')
+    assert compute_weights_fingerprint(tmp_path) != fingerprint
+
+
+class TestReusePipeline:
+    @pytest.fixture(autouse=True)
+    def setup_from_pretrained(self, mocker):
+        self.from_pretrained = mocker.patch(
+            "diffusers.StableDiffusionPipeline.from_pretrained"
+        )
+
+    def test_reuse(self, tmp_path):
+        first = TextToImage(tmp_path, device_id="cpu")
+        second = TextToImage(tmp_path, device_id="cpu")
+
+        self.from_pretrained.assert_called_once()
+        assert second._pipe is first._pipe
+
+    def test_different_settings(self, tmp_path):
+        TextToImage(tmp_path, device_id="cpu")
+        TextToImage(tmp_path, device_id="cpu", enable_attention_slicing=True)
+
+        assert self.from_pretrained.call_count == 2
+
+    def test_disabled(self, tmp_path):
+        TextToImage(tmp_path, device_id="cpu", reuse_pipeline=False)
+        TextToImage(tmp_path, device_id="cpu", reuse_pipeline=False)
+
+        assert self.from_pretrained.call_count == 2
+        assert len(get_pipeline_registry()) == 0
+
+    def test_release(self, tmp_path):
+        generator = TextToImage(tmp_path, device_id="cpu")
+        generator.release()
+        TextToImage(tmp_path, device_id="cpu")
+
+        assert self.from_pretrained.call_count == 2
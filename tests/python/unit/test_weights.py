@@ -0,0 +1,106 @@
+import pytest
+import torch
+from diffusers import StableDiffusionPipeline
+
+from ai_art.folder import RemoteFile
+from ai_art.weights import select_pipeline_files
+
+MODEL_INDEX = {
+    "_class_name": "StableDiffusionPipeline",
+    "_diffusers_version": "0.10.2",
+    "feature_extractor": ["transformers", "CLIPFeatureExtractor"],
+    "safety_checker": [None, None],
+    "scheduler": ["diffusers", "PNDMScheduler"],
+    "text_encoder": ["transformers", "CLIPTextModel"],
+    "tokenizer": ["transformers", "CLIPTokenizer"],
+    "unet": ["diffusers", "UNet2DConditionModel"],
+    "vae": ["diffusers", "AutoencoderKL"],
+}
+
+REMOTE_PATHS = (
+    "/.gitattributes",
+    "/.git/HEAD",
+    "/model_index.json",
+    "/v1-5-pruned-emaonly.ckpt",
+    "/feature_extractor/preprocessor_config.json",
+    "/safety_checker/config.json",
+    "/safety_checker/pytorch_model.bin",
+    "/scheduler/scheduler_config.json",
+    "/text_encoder/config.json",
+    "/text_encoder/pytorch_model.bin",
+    "/text_encoder/model.safetensors",
+    "/text_encoder/flax_model.msgpack",
+    "/tokenizer/merges.txt",
+    "/tokenizer/vocab.json",
+    "/unet/config.json",
+    "/unet/diffusion_pytorch_model.bin",
+    "/unet/diffusion_pytorch_model.fp16.bin",
+    "/unet/diffusion_pytorch_model.non_ema.bin",
+    "/vae/config.json",
+    "/vae/diffusion_pytorch_model.bin",
+)
+
+
+def _select(torch_dtype=None):
+    """Select the files of `REMOTE_PATHS`
+
+    :return: Selected files, mapped to their local paths
+    :rtype: dict[str, str]
+    """
+    remote_files = [RemoteFile(path, 100, 1) for path in REMOTE_PATHS]
+    selected_files = select_pipeline_files(
+        remote_files,
+        MODEL_INDEX,
+        StableDiffusionPipeline,
+        torch_dtype=torch_dtype,
+    )
+    return {
+        remote_file.path: remote_file.local_path or remote_file.path
+        for remote_file in selected_files
+    }
+
+
+class TestSelectPipelineFiles:
+    @pytest.fixture(autouse=True)
+    def safetensors_available(self, mocker):
+        """Pretend that the safetensors library is installed"""
+        mocker.patch(
+            "ai_art.weights.is_safetensors_available", return_value=True
+        )
+
+    def test_skip_unused_files(self):
+        selected_files = _select()
+        assert set(selected_files) == {
+            "/model_index.json",
+            "/feature_extractor/preprocessor_config.json",
+            "/scheduler/scheduler_config.json",
+            "/text_encoder/config.json",
+            "/text_encoder/model.safetensors",
+            "/tokenizer/merges.txt",
+            "/tokenizer/vocab.json",
+            "/unet/config.json",
+            "/unet/diffusion_pytorch_model.bin",
+            "/vae/config.json",
+            "/vae/diffusion_pytorch_model.bin",
+        }
+
+    def test_half_precision_variant(self):
+        selected_files = _select(torch_dtype=torch.float16)
+
+        assert "/unet/diffusion_pytorch_model.bin" not in selected_files
+        # The variant is downloaded under the default name
+        assert (
+            selected_files["/unet/diffusion_pytorch_model.fp16.bin"]
+            == "/unet/diffusion_pytorch_model.bin"
+        )
+        # Components without variants are unaffected
+        assert "/vae/diffusion_pytorch_model.bin" in selected_files
+
+    def test_bin_without_safetensors_library(self, mocker):
+        mocker.patch(
+            "ai_art.weights.is_safetensors_available", return_value=False
+        )
+        selected_files = _select()
+
+        assert "/text_encoder/pytorch_model.bin" in selected_files
+        assert "/text_encoder/model.safetensors" not in selected_files